@@ -5,15 +5,36 @@ Remove distortion of camera lens and project to the real world coordinates.
 (C) 2016-2019 1024jp
 """
 
+import gzip
 import io
+import json
 import os
+import pickle
+import signal
+import tempfile
+import threading
+import time
 import unittest
+import uuid
+import zlib
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
 
+import cv2
 import numpy as np
 
 from modules import argsparser
+from modules.checkpoint import Checkpoint, DEFAULT_INTERVAL, fingerprint
+from modules.checkpoint import SUFFIX as CHECKPOINT_SUFFIX
+from modules import compression
+from modules.compression import compression_of, open_text
+from modules import datafile
 from modules.datafile import Data
+from modules.jobqueue import DEFAULT_STALE_TIMEOUT, Manifest, WorkQueue
+from modules.modelstore import attach_models, publish_models
+from modules.patches import PatchUndistorter
+from modules.follow import DEFAULT_LATENCY
 from modules.undistortion import Undistorter
 from modules.projection import Projector
 
@@ -21,21 +42,224 @@ from modules.projection import Projector
 DEFAULT_IMAGE_SIZE = (3840, 2160)
 
 
-def main(data, outfile, camerafile=None, size=DEFAULT_IMAGE_SIZE):
+class ArgsParser(argsparser.Parser):
+    datafile_required = False
+    opens_output = False
+
+    def init_arguments(self):
+        super(ArgsParser, self).init_arguments()
+
+        mode = self.add_argument_group('mode options')
+        mode.add_argument('--inverse',
+                          action='store_true',
+                          default=False,
+                          help="translate real-world coordinates back to"
+                               " the original picture"
+                               " (default: %(default)s)"
+                          )
+        mode.add_argument('--follow',
+                          action='store_true',
+                          default=False,
+                          help="keep translating rows appended to the"
+                               " source file"
+                               " (default: %(default)s)"
+                          )
+        mode.add_argument('--latency',
+                          type=float,
+                          default=DEFAULT_LATENCY,
+                          metavar='SECONDS',
+                          help="maximum delay to output appended rows"
+                               " in --follow mode"
+                               " (default: %(default)s)"
+                          )
+        mode.add_argument('--piecewise',
+                          action='store_true',
+                          default=False,
+                          help="project with local transforms on triangles"
+                               " of reference points"
+                               " (default: %(default)s)"
+                          )
+
+        checkpoint = self.add_argument_group('checkpoint options')
+        checkpoint.add_argument('--checkpoint',
+                                type=str,
+                                default=None,
+                                metavar='FILE',
+                                help="path to checkpoint file to save"
+                                     " progress periodically"
+                                     " (default: output file path + {} with"
+                                     " --resume)".format(CHECKPOINT_SUFFIX)
+                                )
+        checkpoint.add_argument('--checkpoint_interval',
+                                type=float,
+                                default=DEFAULT_INTERVAL,
+                                metavar='SECONDS',
+                                help="interval to save checkpoint"
+                                     " (default: %(default)s)"
+                                )
+        checkpoint.add_argument('--resume',
+                                action='store_true',
+                                default=False,
+                                help="continue from the checkpoint if exists"
+                                     " (default: %(default)s)"
+                                )
+
+        manifest = self.add_argument_group('manifest options')
+        manifest.add_argument('--manifest',
+                              type=str,
+                              default=None,
+                              metavar='FILE',
+                              help="process jobs listed in manifest file"
+                                   " together with workers on other nodes"
+                                   " sharing the filesystem"
+                              )
+        manifest.add_argument('--workers',
+                              type=int,
+                              default=1,
+                              metavar='NUMBER',
+                              help="number of local worker processes"
+                                   " for --manifest"
+                                   " (default: %(default)s)"
+                              )
+        manifest.add_argument('--stale_timeout',
+                              type=float,
+                              default=DEFAULT_STALE_TIMEOUT,
+                              metavar='SECONDS',
+                              help="time after which a shard claimed by a"
+                                   " silent worker is taken over"
+                                   " (default: %(default)s)"
+                              )
+
+    def parse_args(self, **kwargs):
+        args = super(ArgsParser, self).parse_args(**kwargs)
+
+        if not (args.test or args.file or args.manifest):
+            self.error('This script requires a path to a {} file or'
+                       ' --manifest.\n'.format(self.datafile_name))
+        if args.manifest and (args.file or args.follow or args.resume or
+                              args.checkpoint):
+            self.error('--manifest can be used neither with a source file'
+                       ' nor with --follow or checkpoint options.')
+
+        if args.checkpoint or args.resume:
+            if args.out is sys.stdout:
+                self.error('Checkpoint requires --out file.')
+            if args.follow:
+                self.error('Checkpoint is not available in --follow mode.')
+            if compression_of(args.out):
+                self.error('Checkpoint requires uncompressed output file.')
+            if args.file and compression_of(args.file.name):
+                self.error('Checkpoint requires uncompressed source file.')
+            if not args.checkpoint:
+                args.checkpoint = args.out + CHECKPOINT_SUFFIX
+
+        # keep output to truncate it to the checkpoint
+        if args.resume and os.path.exists(args.checkpoint):
+            try:
+                args.out = open(args.out, 'r+')
+            except OSError as error:
+                self.error("can't open output file of checkpoint {}: {}"
+                           .format(args.checkpoint, error))
+        elif args.out is not sys.stdout:
+            args.out = argsparser.output_file(args.out)
+
+        return args
+
+
+def model_fingerprint(data, camerafile=None, size=DEFAULT_IMAGE_SIZE,
+                      piecewise=False, inverses=False):
+    """Return digest of models and settings to validate checkpoint.
+    """
+    camera = b''
+    if camerafile:
+        camera = camerafile.read()
+        camerafile.seek(0)
+
+    return fingerprint(os.path.abspath(data.datafile.name),
+                       np.ascontiguousarray(data.dest_points),
+                       np.ascontiguousarray(data.image_points), camera,
+                       tuple(size), piecewise, inverses, tuple(data.in_cols),
+                       tuple(data.out_cols), data.z_col)
+
+
+def init_models(data, camerafile=None, size=DEFAULT_IMAGE_SIZE,
+                piecewise=False):
+    """Create undistorter and projector for undistorted points.
+
+    Arguments:
+    data (Data) -- Data source instance.
+    camerafile (file) -- Camera model file or None to use reference points.
+    size (int, int) -- Width and height of source image.
+    piecewise (bool) -- Whether to project with local transforms.
+    """
     if camerafile:
         undistorter = Undistorter.load(camerafile)
     else:
         undistorter = Undistorter.init(data.image_points, data.dest_points,
                                        size)
     undistorded_refpoints = undistorter.calibrate_points(data.image_points)
-    projector = Projector(undistorded_refpoints.tolist(),
-                          data.dest_points)
+    projector = Projector(undistorded_refpoints, data.dest_points,
+                          piecewise)
+
+    return undistorter, projector
+
+
+def load_models(data, camerafile=None, size=DEFAULT_IMAGE_SIZE,
+                piecewise=False, checkpoint=None):
+    """Return models stored in checkpoint or create them.
+    """
+    if checkpoint and checkpoint.models:
+        return checkpoint.models
+
+    models = init_models(data, camerafile, size, piecewise)
+    if checkpoint:
+        checkpoint.models = models
+    return models
+
+
+def forward_handler(undistorter, projector):
+    """Return batch handler translating image points to the real world.
+    """
+    def batch_handler(points, zs):
+        points = undistorter.calibrate_points(points).reshape(-1, 2)
+        return projector.project_points(points, zs)
+    return batch_handler
+
+
+def inverse_handler(undistorter, projector):
+    """Return batch handler translating real-world points to the image.
+    """
+    def batch_handler(points, zs):
+        points = projector.unproject_points(points, zs)
+        return undistorter.distort_points(points)
+    return batch_handler
+
+
+def main(data, outfile, camerafile=None, size=DEFAULT_IMAGE_SIZE,
+         piecewise=False, checkpoint=None):
+    undistorter, projector = load_models(data, camerafile, size, piecewise,
+                                         checkpoint)
 
     # process data file
-    def processor_handler(x, y, z):
-        x, y = undistorter.calibrate_points([(x, y)])
-        return projector.project_point(x, y, z)
-    data.process_coordinates(processor_handler, outfile)
+    data.process_coordinate_batches(forward_handler(undistorter, projector),
+                                    outfile, checkpoint=checkpoint)
+
+
+def follow(data, outfile, camerafile=None, size=DEFAULT_IMAGE_SIZE,
+           piecewise=False, inverses=False, latency=DEFAULT_LATENCY,
+           idle_timeout=None):
+    undistorter, projector = init_models(data, camerafile, size, piecewise)
+
+    # process rows appended to data file
+    if inverses:
+        batch_handler = inverse_handler(undistorter, projector)
+    else:
+        batch_handler = forward_handler(undistorter, projector)
+    try:
+        data.follow_coordinates(batch_handler, outfile, latency,
+                                idle_timeout)
+    except KeyboardInterrupt:
+        pass  # stop following
 
 
 def undistort(data, outfile, camerafile=None, size=DEFAULT_IMAGE_SIZE):
@@ -51,6 +275,118 @@ def undistort(data, outfile, camerafile=None, size=DEFAULT_IMAGE_SIZE):
     data.process_coordinates(processor_handler, outfile)
 
 
+def inverse(data, outfile, camerafile=None, size=DEFAULT_IMAGE_SIZE,
+            piecewise=False, checkpoint=None):
+    undistorter, projector = load_models(data, camerafile, size, piecewise,
+                                         checkpoint)
+
+    # process data file
+    data.process_coordinate_batches(inverse_handler(undistorter, projector),
+                                    outfile, checkpoint=checkpoint)
+
+
+def load_job_models(data, store_path, camera_path=None,
+                    size=DEFAULT_IMAGE_SIZE, piecewise=False):
+    """Return models of a manifest job shared through the work directory.
+
+    The first worker processing the job creates the models and the others
+    attach to the stored ones.
+    """
+    if os.path.exists(store_path):
+        return attach_models(store_path)
+
+    if camera_path:
+        with open(camera_path, 'rb') as camerafile:
+            models = init_models(data, camerafile, size, piecewise)
+    else:
+        models = init_models(data, size=size, piecewise=piecewise)
+
+    # publish under unique name not to clash with other workers
+    store = publish_models(*models, includes_maps=False,
+                           path='{}.{}'.format(store_path, uuid.uuid4().hex))
+    store.close()
+    os.replace(store.path, store_path)
+    return models
+
+
+def work(manifest_path, camera_path=None, size=DEFAULT_IMAGE_SIZE,
+         piecewise=False, inverses=False, in_cols=None, z_col=None,
+         stale_timeout=DEFAULT_STALE_TIMEOUT, waits=True):
+    """Process shards of jobs in manifest until all of them are done.
+
+    Arguments:
+    manifest_path (str) -- Path to manifest file.
+    camera_path (str) -- Camera model file for jobs without camera or None.
+    stale_timeout (float) -- Seconds to take over shards of silent workers.
+    waits (bool) -- Whether to wait for shards claimed by other workers
+                    instead of returning when no shard can be claimed.
+
+    Returns:
+    count (int) -- Number of shards processed by this worker.
+    """
+    manifest = Manifest(manifest_path)
+    queue = WorkQueue(manifest.workdir, stale_timeout)
+    tasks = {task: (job_index, job, shard)
+             for task, job_index, job, shard in manifest.tasks()}
+    handlers = {}
+
+    count = 0
+    for claim in queue.claims(list(tasks), waits):
+        job_index, job, (start, end) = tasks[claim.task]
+        part_path = manifest.part_path(claim.task, job, temporary=True)
+        try:
+            with open(job['input'], 'rb') as f:
+                data = Data(f, loc_path=job['location'], in_cols=in_cols,
+                            z_col=z_col)
+            if job_index not in handlers:
+                models = load_job_models(data, manifest.models_path(job_index),
+                                         job['camera'] or camera_path, size,
+                                         piecewise)
+                handler = inverse_handler if inverses else forward_handler
+                handlers[job_index] = handler(*models)
+
+            with open_text(part_path, 'w') as out:
+                data.process_coordinate_range(
+                        handlers[job_index], out, start, end,
+                        progress_handler=claim.heartbeat)
+            os.replace(part_path, manifest.part_path(claim.task, job))
+        except BaseException:
+            claim.release()
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        claim.complete()
+        count += 1
+
+    return count
+
+
+def run_manifest(manifest_path, workers=1, **kwargs):
+    """Process manifest with local worker processes and merge outputs.
+
+    Arguments:
+    manifest_path (str) -- Path to manifest file.
+    workers (int) -- Number of local worker processes.
+    kwargs -- Options passed to work().
+
+    Returns:
+    merged ([str]) -- Paths to outputs merged by this node.
+    """
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(work, manifest_path, waits=False,
+                                       **kwargs)
+                       for _ in range(workers)]
+            for future in futures:
+                future.result()
+
+    # wait for shards of other nodes taking over those of dead ones
+    work(manifest_path, **kwargs)
+
+    manifest = Manifest(manifest_path)
+    return manifest.merge(WorkQueue(manifest.workdir))
+
+
 def project(data, outfile):
     projector = Projector(data.image_points, data.dest_points)
 
@@ -101,9 +437,424 @@ class TestCase(unittest.TestCase):
                                        expected_result.splitlines()):
             self.assertEqual(line, expected_line)
 
+    def test_location(self):
+        with tempfile.TemporaryDirectory() as dirpath:
+            location_path = os.path.join(dirpath, 'sub', 'Location.csv')
+            os.mkdir(os.path.dirname(location_path))
+            with open(location_path, 'w') as f:
+                f.write('"x","y","z","j","i"\n'
+                        '# comment\n'
+                        ',,,,\n'
+                        '1,2,3,4,5\n'
+                        '"6","7","8","9","10"\n')
+            os.utime(location_path, ns=(10 ** 9, 10 ** 9))
+
+            # find file in subdirectory of parent directory
+            filepath = os.path.join(dirpath, 'data', 'tracklog.tsv')
+            os.mkdir(os.path.dirname(filepath))
+            with open(filepath, 'w') as f:
+                f.write("id\ttime\tx\ty\n")
+            with open(filepath) as f:
+                data = Data(f, loc_path=location_path)
+            self.assertEqual(data._find_file('Location.csv', 'sub'),
+                             [location_path])
+
+            # header, comment and row with empty first cell are skipped
+            expected = [[1, 2, 3, 4, 5], [6, 7, 8, 9, 10]]
+            np.testing.assert_array_equal(data.dest_points,
+                                          np.array(expected)[:, 0:3])
+            np.testing.assert_array_equal(data.image_points,
+                                          np.array(expected)[:, 3:5])
+
+            # binary cache is used without parsing
+            datafile._locations.clear()
+            with mock.patch.object(datafile, '_parse_location') as parse:
+                np.testing.assert_array_equal(
+                        datafile.load_location(location_path), expected)
+                parse.assert_not_called()
+
+            # both caches are invalidated by modification
+            with open(location_path, 'a') as f:
+                f.write("11,12,13,14,15\n")
+            os.utime(location_path, ns=(2 * 10 ** 9, 2 * 10 ** 9))
+            expected.append([11, 12, 13, 14, 15])
+            np.testing.assert_array_equal(
+                    datafile.load_location(location_path), expected)
+            datafile._locations.clear()
+            np.testing.assert_array_equal(
+                    datafile.load_location(location_path), expected)
+            filenames = sorted(os.listdir(os.path.dirname(location_path)))
+            self.assertEqual(filenames, ['.Location.csv.npy', 'Location.csv'])
+
+    def test_inverse(self):
+        test_dir = os.path.join(os.path.dirname(__file__), self.dirname)
+        filepath = os.path.join(test_dir, 'tracklog.tsv')
+
+        with open(filepath, 'r') as f:
+            data = Data(f)
+        undistorter, projector = init_models(data)
+
+        # round trip of the reference points
+        zs = data.dest_points[:, 2]
+        points = undistorter.calibrate_points(data.image_points)
+        points = projector.project_points(points, zs)
+        points = projector.unproject_points(points, zs)
+        points = undistorter.distort_points(points)
+
+        np.testing.assert_allclose(points, data.image_points, atol=1)
+
+    def test_lost_target(self):
+        test_dir = os.path.join(os.path.dirname(__file__), self.dirname)
+        location_path = os.path.join(test_dir, 'Location.csv')
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            filepath = os.path.join(dirpath, 'tracklog.tsv')
+            with open(filepath, 'w') as f:
+                f.write("id\ttime\tx\ty\n"
+                        "1\t0.5\tnan\t100\n"
+                        "2\t0.5\t1000\t1000\n")
+
+            for process in (main, inverse):
+                for piecewise in (False, True):
+                    out = io.StringIO()
+                    with open(filepath) as f:
+                        data = Data(f, loc_path=location_path)
+                    process(data, out, piecewise=piecewise)
+
+                    # row without position is left as is
+                    lines = out.getvalue().splitlines()
+                    self.assertEqual(lines[1], "1\t0.5\tnan\t100")
+                    self.assertNotEqual(lines[2], "2\t0.5\t1000\t1000")
+
+    def test_piecewise(self):
+        test_dir = os.path.join(os.path.dirname(__file__), self.dirname)
+        filepath = os.path.join(test_dir, 'tracklog.tsv')
+
+        with open(filepath, 'r') as f:
+            data = Data(f)
+        projector = Projector(data.image_points, data.dest_points,
+                              piecewise=True)
+
+        # reference points are the vertices of the triangulation
+        zs = data.dest_points[:, 2]
+        points = projector.project_points(data.image_points, zs)
+        np.testing.assert_allclose(points, data.dest_points[:, :2])
+        points = projector.unproject_points(points, zs)
+        np.testing.assert_allclose(points, data.image_points)
+
+    def test_follow(self):
+        test_dir = os.path.join(os.path.dirname(__file__), self.dirname)
+        with open(os.path.join(test_dir, 'tracklog.tsv')) as f:
+            content = f.read()
+        location_path = os.path.join(test_dir, 'Location.csv')
+
+        expected = io.StringIO()
+        with open(os.path.join(test_dir, 'tracklog.tsv')) as f:
+            main(Data(f, loc_path=location_path), expected)
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            filepath = os.path.join(dirpath, 'tracklog.tsv')
+            with open(filepath, 'w') as f:
+                f.write(content[:100])
+
+            # append the rest while following, splitting a line
+            def append():
+                with open(filepath, 'a') as f:
+                    for start in range(100, len(content), 50):
+                        time.sleep(0.02)
+                        f.write(content[start:start + 50])
+                        f.flush()
+            thread = threading.Thread(target=append)
+            thread.start()
+
+            out = io.StringIO()
+            with open(filepath) as f:
+                data = Data(f, loc_path=location_path)
+            follow(data, out, latency=0.01, idle_timeout=0.5)
+            thread.join()
+
+        self.assertEqual(out.getvalue(), expected.getvalue())
+
+    def test_compression(self):
+        formats = ['.gz']
+        if compression.zstandard:
+            formats.append('.zst')
+
+        # lines and multibyte characters split across blocks
+        text = ''.join('{}\tλ→{}\n'.format(i, 'é' * (i % 7))
+                       for i in range(200)) + 'last line'
+
+        with tempfile.TemporaryDirectory() as dirpath, \
+                mock.patch('modules.compression.BLOCK_SIZE', 5):
+            for extension in formats:
+                path = os.path.join(dirpath, 'data.tsv' + extension)
+                with open_text(path, 'w') as out:
+                    for line in text.splitlines(True):
+                        out.write(line)
+                with open_text(path) as f:
+                    first_line = f.readline()
+                    self.assertEqual(first_line + ''.join(f), text)
+
+                # error in the reader thread is raised in the caller
+                with open(path, 'rb') as f:
+                    content = f.read()
+                with open(path, 'wb') as f:
+                    f.write(content[:len(content) // 2])
+                with self.assertRaises(Exception):
+                    with open_text(path) as f:
+                        list(f)
+
+    def test_compressed_source(self):
+        test_dir = os.path.join(os.path.dirname(__file__), self.dirname)
+        filepath = os.path.join(test_dir, 'tracklog.tsv')
+        location_path = os.path.join(test_dir, 'Location.csv')
+
+        expected = io.StringIO()
+        with open(filepath) as f:
+            main(Data(f), expected)
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            gz_path = os.path.join(dirpath, 'tracklog.tsv.gz')
+            with open(filepath, 'rb') as f, gzip.open(gz_path, 'wb') as out:
+                out.write(f.read())
+
+            out = io.StringIO()
+            with open(gz_path, 'rb') as f:
+                main(Data(f, loc_path=location_path), out)
+
+        self.assertEqual(out.getvalue(), expected.getvalue())
+
+    def test_flush_compressed(self):
+        formats = ['.gz']
+        if compression.zstandard:
+            formats.append('.zst')
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            for extension in formats:
+                path = os.path.join(dirpath, 'out.tsv' + extension)
+                with open_text(path, 'w') as out:
+                    out.write('1\t2\n')
+                    out.flush()
+
+                    # readable before the stream is closed
+                    with open(path, 'rb') as f:
+                        content = f.read()
+                    if extension == '.gz':
+                        decompressor = zlib.decompressobj(wbits=31)
+                    else:
+                        decompressor = (compression.zstandard
+                                        .ZstdDecompressor().decompressobj())
+                    self.assertEqual(decompressor.decompress(content),
+                                     b'1\t2\n')
+
+    def test_resume(self):
+        test_dir = os.path.join(os.path.dirname(__file__), self.dirname)
+        filepath = os.path.join(test_dir, 'tracklog.tsv')
+        with open(filepath, 'rb') as f:
+            input_offset = len(b''.join(f.readlines()[:3]))
+
+        expected = io.StringIO()
+        with open(filepath) as f:
+            data = Data(f)
+        main(data, expected)
+        expected = expected.getvalue()
+        output_offset = len(''.join(expected.splitlines(True)[:3]))
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            checkpoint_path = os.path.join(dirpath, 'checkpoint')
+            digest = model_fingerprint(data)
+            checkpoint = Checkpoint(checkpoint_path, digest)
+            checkpoint.save(input_offset, output_offset)
+
+            # output of a killed run
+            out = io.StringIO(expected[:output_offset] + '1\t9')
+            checkpoint = Checkpoint.load(checkpoint_path, digest)
+            out.seek(checkpoint.output_offset)
+            out.truncate()
+            main(data, out, checkpoint=checkpoint)
+
+            self.assertEqual(out.getvalue(), expected)
+            with self.assertRaises(ValueError):
+                Checkpoint.load(checkpoint_path, 'other')
+
+    def test_model_store(self):
+        test_dir = os.path.join(os.path.dirname(__file__), self.dirname)
+        filepath = os.path.join(test_dir, 'tracklog.tsv')
+
+        with open(filepath, 'r') as f:
+            data = Data(f)
+        undistorter, projector = init_models(data, piecewise=True)
+        expected = forward_handler(undistorter, projector)(
+                data.image_points, data.dest_points[:, 2])
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            path = os.path.join(dirpath, 'models')
+            store = publish_models(undistorter, projector, path=path)
+
+            # workers receive only the path
+            shared = pickle.loads(pickle.dumps(store))
+            models = attach_models(shared)
+            result = forward_handler(*models)(data.image_points,
+                                              data.dest_points[:, 2])
+
+            np.testing.assert_array_equal(result, expected)
+            self.assertFalse(models[0].undistort_maps()[0].flags.writeable)
+            shared.close()
+            store.close()
+
+        # temporary store is removed by the publisher only
+        with publish_models(undistorter, projector) as store:
+            with pickle.loads(pickle.dumps(store)) as shared:
+                np.testing.assert_array_equal(
+                        shared.arrays['camera_matrix'],
+                        undistorter.camera_matrix)
+            self.assertTrue(os.path.exists(store.path))
+        self.assertFalse(os.path.exists(store.path))
+
+    def test_patches(self):
+        test_dir = os.path.join(os.path.dirname(__file__), self.dirname)
+        filepath = os.path.join(test_dir, 'tracklog.tsv')
+
+        with open(filepath, 'r') as f:
+            data = Data(f)
+        undistorter, _ = init_models(data)
+        width, height = undistorter.image_size
+        frame = np.random.default_rng(0).integers(0, 256, (height, width),
+                                                  np.uint8)
+        expected = cv2.remap(frame, *undistorter.undistort_maps(),
+                             cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+
+        # interior, negative buckets at the left and top edges, right edge
+        rois = [(1900, 1000, 40, 30), (100, 2000, 33, 17),
+                (20, 1080, 120, 40), (1900, 60, 40, 200),
+                (3800, 1080, 120, 40)]
+        patches = PatchUndistorter(undistorter).undistort_patches(frame,
+                                                                  rois)
+        centers = undistorter.calibrate_points(
+                np.array(rois, np.float64)[:, :2]).reshape(-1, 2)
+        sizes = np.array(rois)[:, 2:]
+        origins = np.rint(centers - sizes / 2).astype(int)
+        self.assertLess(origins.min(), 0)
+
+        for patch, (left, top), (w, h) in zip(patches, origins.tolist(),
+                                              sizes.tolist()):
+            self.assertEqual(patch.shape, (h, w))
+
+            # compare area inside the undistorted frame
+            x0, y0 = max(left, 0), max(top, 0)
+            x1, y1 = min(left + w, width), min(top + h, height)
+            self.assertGreater(min(x1 - x0, y1 - y0), 0)
+            np.testing.assert_array_equal(
+                    patch[y0 - top:y1 - top, x0 - left:x1 - left],
+                    expected[y0:y1, x0:x1])
+
+        # least recently used grid is evicted
+        patcher = PatchUndistorter(undistorter, cache_size=2)
+        with mock.patch.object(undistorter, 'distort_points',
+                               wraps=undistorter.distort_points) as distort:
+            for index in (0, 1, 0, 2, 0, 1):
+                patcher.undistort_patches(frame, [rois[index]])
+            self.assertEqual(distort.call_count, 4)
+
+    def test_manifest(self):
+        test_dir = os.path.join(os.path.dirname(__file__), self.dirname)
+        filepath = os.path.join(test_dir, 'tracklog.tsv')
+
+        expected = io.StringIO()
+        with open(filepath) as f:
+            main(Data(f), expected)
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            for filename in ('tracklog.tsv', 'Location.csv'):
+                with open(os.path.join(test_dir, filename), 'rb') as f:
+                    content = f.read()
+                with open(os.path.join(dirpath, filename), 'wb') as f:
+                    f.write(content)
+            manifest_path = os.path.join(dirpath, 'manifest.json')
+            with open(manifest_path, 'w') as f:
+                json.dump({'shard_size': 100,
+                           'jobs': [{'input': 'tracklog.tsv',
+                                     'output': 'result.tsv'}]}, f)
+
+            # shard left by a dead worker
+            manifest = Manifest(manifest_path)
+            shards = manifest.jobs[0]['shards']
+
+            # other nodes keep the plan even if the input looks different
+            with mock.patch('os.path.getsize', return_value=1):
+                self.assertEqual(Manifest(manifest_path).jobs[0]['shards'],
+                                 shards)
+            queue = WorkQueue(manifest.workdir)
+            self.assertTrue(queue.claim(manifest.task_name(0, 1)))
+            past = time.time() - 10
+            os.utime(queue.path(manifest.task_name(0, 1), '.lock'),
+                     (past, past))
+
+            merged = run_manifest(manifest_path, workers=3, stale_timeout=5)
+
+            self.assertEqual(merged, [os.path.join(dirpath, 'result.tsv')])
+            with open(merged[0], newline='') as f:
+                self.assertEqual(f.read(), expected.getvalue())
+            self.assertFalse([name for name in os.listdir(manifest.workdir)
+                              if '.part' in name])
+
+    def test_lock_takeover(self):
+        with tempfile.TemporaryDirectory() as dirpath:
+            queue = WorkQueue(dirpath, stale_timeout=5)
+            slow = queue.claim('shard')
+            self.assertIsNone(queue.claim('shard'))
+
+            past = time.time() - 10
+            os.utime(queue.path('shard', '.lock'), (past, past))
+            claim = queue.claim('shard')
+            self.assertTrue(claim)
+
+            # slow worker must not release the lock taken over
+            slow.release()
+            self.assertFalse(slow.is_owned)
+            self.assertTrue(claim.is_owned)
+            self.assertIsNone(queue.claim('shard'))
+
+            claim.complete()
+            self.assertTrue(queue.is_done('shard'))
+            self.assertEqual(os.listdir(dirpath), ['shard.done'])
+
+    def test_compressed_shard_heartbeat(self):
+        test_dir = os.path.join(os.path.dirname(__file__), self.dirname)
+        filepath = os.path.join(test_dir, 'tracklog.tsv')
+        location_path = os.path.join(test_dir, 'Location.csv')
+
+        with open(filepath, 'rb') as f:
+            content = f.read()
+        with open(filepath) as f:
+            data = Data(f)
+        handler = forward_handler(*init_models(data))
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            gz_path = os.path.join(dirpath, 'tracklog.tsv.gz')
+            with gzip.open(gz_path, 'wb') as f:
+                f.write(content)
+            with open(gz_path, 'rb') as f:
+                data = Data(f, loc_path=location_path)
+
+            queue = WorkQueue(os.path.join(dirpath, 'work'))
+            claim = queue.claim('shard')
+            lock_path = queue.path('shard', '.lock')
+            past = time.time() - 1000
+            os.utime(lock_path, (past, past))
+
+            # compressed source is processed as a single shard
+            with mock.patch('modules.jobqueue.HEARTBEAT_INTERVAL', 0):
+                data.process_coordinate_range(
+                        handler, io.StringIO(), batch_size=2,
+                        progress_handler=claim.heartbeat)
+
+            self.assertGreater(os.stat(lock_path).st_mtime, past + 900)
+            claim.complete()
+
 
 if __name__ == "__main__":
-    parser = argsparser.Parser()
+    parser = ArgsParser()
     args = parser.parse_args()
 
     if args.test:
@@ -111,8 +862,56 @@ if __name__ == "__main__":
         unittest.TextTestRunner().run(suite)
         sys.exit()
 
+    if args.manifest:
+        merged = run_manifest(args.manifest, args.workers,
+                              camera_path=args.camera and args.camera.name,
+                              size=args.size, piecewise=args.piecewise,
+                              inverses=args.inverse, in_cols=args.in_cols,
+                              z_col=args.z_col,
+                              stale_timeout=args.stale_timeout)
+        for path in merged:
+            print(path)
+        sys.exit()
+
     data = Data(args.file, loc_path=args.location, in_cols=args.in_cols,
                 z_col=args.z_col)
-    main(data, args.out, args.camera, args.size)
+
+    checkpoint = None
+    if args.checkpoint:
+        digest = model_fingerprint(data, args.camera, args.size,
+                                   args.piecewise, args.inverse)
+        if args.resume:
+            checkpoint = Checkpoint.load(args.checkpoint, digest,
+                                         args.checkpoint_interval)
+        else:
+            checkpoint = Checkpoint(args.checkpoint, digest,
+                                    args.checkpoint_interval)
+
+        # drop output after the checkpoint
+        if os.fstat(args.out.fileno()).st_size < checkpoint.output_offset:
+            parser.error('Output file {} is shorter than recorded in'
+                         ' checkpoint {}.'.format(args.out.name,
+                                                  args.checkpoint))
+        args.out.seek(checkpoint.output_offset)
+        args.out.truncate()
+
+    try:
+        if args.follow:
+            # finish output stream also when terminated
+            signal.signal(signal.SIGTERM, lambda *args: sys.exit())
+            follow(data, args.out, args.camera, args.size, args.piecewise,
+                   args.inverse, args.latency)
+        elif args.inverse:
+            inverse(data, args.out, args.camera, args.size, args.piecewise,
+                    checkpoint)
+        else:
+            main(data, args.out, args.camera, args.size, args.piecewise,
+                 checkpoint)
+        if checkpoint:
+            checkpoint.remove()
+    finally:
+        # finish compression of output file
+        if args.out is not sys.stdout:
+            args.out.close()
 #     undistort(data, args.out, args.size)
 #     project(data, args.out)
@@ -8,22 +8,35 @@ Undistort image.
 import math
 import os
 import sys
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+from urllib.parse import quote
 
 import cv2
 import numpy as np
 
 from modules import argsparser
 from modules.datafile import Data
+from modules.jobqueue import WorkQueue
 from modules.undistortion import Undistorter
 from modules.projection import Projector
+from modules.mosaic import Mosaic
 
 # constants
 SUFFIX = "_calib"
+MOSAIC_SUFFIX = "_mosaic"
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.m4v')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp')
+NO_CAMERA = '-'
+GENERATED_SUFFIXES = (SUFFIX, MOSAIC_SUFFIX, '_map')  # outputs of the tools
 
 
 class ArgsParser(argsparser.Parser):
     description = 'Undistort image based on a location file.'
     datafile_name = 'image'
+    datafile_required = False
 
     def init_arguments(self):
         super(ArgsParser, self).init_arguments()
@@ -41,6 +54,13 @@ class ArgsParser(argsparser.Parser):
                             help="also remove perspective"
                                  " (default: %(default)s)"
                             )
+        script.add_argument('--height',
+                            type=float,
+                            default=None,
+                            metavar='MM',
+                            help="height of the plane to project on"
+                                 " (default: first height in location file)"
+                            )
         script.add_argument('--stats',
                             action='store_true',
                             default=False,
@@ -48,6 +68,65 @@ class ArgsParser(argsparser.Parser):
                                  " (default: %(default)s)"
                             )
 
+        batch = self.add_argument_group('batch options')
+        batch.add_argument('--batch',
+                           type=str,
+                           default=None,
+                           metavar='PATH',
+                           help="directory or glob pattern of images sharing"
+                                " a location file to save calibrated images"
+                                " without displaying them"
+                           )
+        batch.add_argument('--outdir',
+                           type=str,
+                           default=None,
+                           metavar='DIR',
+                           help="directory to save results of --batch"
+                                " (default: directory of each image)"
+                           )
+        batch.add_argument('--jobs',
+                           type=int,
+                           default=None,
+                           metavar='NUMBER',
+                           help="number of threads for --batch"
+                                " (default: number of processors)"
+                           )
+        batch.add_argument('--queue',
+                           type=str,
+                           default=None,
+                           metavar='DIR',
+                           help="shared directory to split --batch with"
+                                " workers on other nodes"
+                           )
+
+        mosaic = self.add_argument_group('mosaic options')
+        mosaic.add_argument('--mosaic',
+                            nargs=3,
+                            action='append',
+                            default=None,
+                            metavar=('IMAGE', 'LOCATION', 'CAMERA'),
+                            help="image or video of a camera with its"
+                                 " location file and camera model file"
+                                 " ('{}' to use the location file);"
+                                 " repeat for each camera".format(NO_CAMERA)
+                            )
+        mosaic.add_argument('--width',
+                            type=int,
+                            default=None,
+                            metavar='PIXEL',
+                            help="width of the mosaic"
+                                 " (default: width of the first image)"
+                            )
+
+    def parse_args(self, **kwargs):
+        args = super(ArgsParser, self).parse_args(**kwargs)
+
+        if not (args.test or args.file or args.mosaic or args.batch):
+            self.error('This script requires a path to an {} file,'
+                       ' --batch or --mosaic.\n'.format(self.datafile_name))
+
+        return args
+
 
 def add_suffix_to_path(path, suffix):
     """Append suffix  to file name before file extension.
@@ -101,11 +180,16 @@ def plot_points(image, points, color=(0, 0, 255)):
     for point in points:
         point = tuple(map(int, point))
         cv2.circle(image, point, color=color, radius=radius,
-                   thickness=radius/2)
+                   thickness=max(1, radius // 2))
 
 
-def estimate_clipping_rect(projector, size):
+def estimate_clipping_rect(projector, size, z=None):
     """
+    Arguments:
+    projector (Projector) -- Projector to project image corners.
+    size (int, int) -- Width and height of source image.
+    z (float) -- Height of the plane to project on.
+
     Return:
     rect -- NSRect style 2d-tuple.
     flipped (bool) -- Whether y-axis is flipped.
@@ -115,7 +199,7 @@ def estimate_clipping_rect(projector, size):
     x_points = []
     y_points = []
     for corner in image_corners:
-        x, y = map(int, projector.project_point(*corner))
+        x, y = map(int, projector.project_point(*corner, z))
         x_points.append(x)
         y_points.append(y)
     min_x = min(x_points)
@@ -129,57 +213,105 @@ def estimate_clipping_rect(projector, size):
     return rect, flipped
 
 
-def main(data, saves_file=False, removes_perspective=True, shows_stats=False):
-    imgpath = data.datafile.name
-    image = cv2.imread(imgpath)
-    size = image.shape[::-1][1:3]
-
-    undistorter = Undistorter.init(data.image_points, data.dest_points, size)
-
-    image = undistorter.undistort_image(image)
-    undistorted_points = undistorter.calibrate_points(data.image_points)
-
-    plot_points(image, undistorted_points)
-
-    if shows_stats:
+class ImageCalibrator:
+    def __init__(self, data, size, removes_perspective=True, height=None,
+                 max_workers=None):
+        """Fit models once to calibrate images sharing a location file.
+
+        Arguments:
+        data (Data) -- Data source instance.
+        size (int, int) -- Width and height of the images.
+        removes_perspective (bool) -- Whether to also remove perspective.
+        height (float) -- Height of the plane to project on.
+        max_workers (int) -- Number of threads to remove perspective.
+        """
+        self.data = data
+        self.size = size
+        self.height = height
+        self.max_workers = max_workers
+
+        self.undistorter = Undistorter.init(data.image_points,
+                                            data.dest_points, size)
+        self.undistorter.undistort_maps()  # build remap tables in advance
+        self.undistorted_points = self.undistorter.calibrate_points(
+                data.image_points)
+
+        self.projector = None
+        if removes_perspective:
+            self.projector = Projector(self.undistorted_points,
+                                       data.dest_points)
+            rect, self.is_flipped = estimate_clipping_rect(self.projector,
+                                                           size, height)
+            self.rect = rect
+
+            # project directly into the source width
+            self.scale = float(size[0]) / rect[1][0]
+            self.out_size = (size[0], int(self.scale * rect[1][1]))
+
+    def print_stats(self):
         print('[stats]')
-        print('number of points: {}'.format(len(undistorted_points)))
-
-    if removes_perspective:
-        projector = Projector(undistorted_points, data.dest_points)
-
-        # show stats if needed
-        if shows_stats:
-            diffs = []
-            for point, (dest_x, dest_y, dest_z) in zip(undistorted_points,
-                                                       data.dest_points):
-                x, y = projector.project_point(*point)
-                diffs.append([x - dest_x, y - dest_y])
-            abs_diffs = [(abs(x), abs(y)) for x, y in diffs]
-            print('mean: {:.2f}, {:.2f}'.format(*np.mean(abs_diffs, axis=0)))
-            print(' std: {:.2f}, {:.2f}'.format(*np.std(abs_diffs, axis=0)))
-            print(' max: {:.2f}, {:.2f}'.format(*np.max(abs_diffs, axis=0)))
-            print('diff:')
-            for x, y in diffs:
-                print('     {:6.1f},{:6.1f}'.format(x, y))
+        print('number of points: {}'.format(len(self.undistorted_points)))
+
+        if not self.projector:
+            return
+
+        diffs = []
+        for point, (dest_x, dest_y, dest_z) in zip(self.undistorted_points,
+                                                   self.data.dest_points):
+            x, y = self.projector.project_point(*point)
+            diffs.append([x - dest_x, y - dest_y])
+        abs_diffs = [(abs(x), abs(y)) for x, y in diffs]
+        print('mean: {:.2f}, {:.2f}'.format(*np.mean(abs_diffs, axis=0)))
+        print(' std: {:.2f}, {:.2f}'.format(*np.std(abs_diffs, axis=0)))
+        print(' max: {:.2f}, {:.2f}'.format(*np.max(abs_diffs, axis=0)))
+        print('diff:')
+        for x, y in diffs:
+            print('     {:6.1f},{:6.1f}'.format(x, y))
+
+    def calibrate(self, image):
+        """Return undistorted (and projected) image with reference points.
+
+        Arguments:
+        image (numpy.array) -- Image of the size given on initialization.
+        """
+        map_x, map_y = self.undistorter.undistort_maps()
+        image = cv2.remap(image, map_x, map_y, cv2.INTER_LINEAR)
+
+        plot_points(image, self.undistorted_points)
+
+        if not self.projector:
+            return image
 
         # transform image by removing perspective
-        rect, is_flipped = estimate_clipping_rect(projector, size)
-
-        image = projector.project_image(image, rect[1], rect[0])
+        image = self.projector.project_image(image, self.out_size,
+                                             self.rect[0], self.height,
+                                             scale=self.scale,
+                                             max_workers=self.max_workers)
 
-        scale = float(size[0]) / image.shape[1]
-        image = scale_image(image, scale)
-
-        for point in data.dest_points:
+        for point in self.data.dest_points:
             point = point[0:2]
-            point = [scale * (l - origin) for l, origin in zip(point, rect[0])]
+            point = [self.scale * (length - origin)
+                     for length, origin in zip(point, self.rect[0])]
             plot_points(image, [point], color=(255, 128, 0))
 
         # flip image if needed
-        if is_flipped:
+        if self.is_flipped:
             image = cv2.flip(image, 0)
 
+        return image
+
+
+def main(data, saves_file=False, removes_perspective=True, shows_stats=False,
+         height=None):
+    imgpath = data.datafile.name
+    image = cv2.imread(imgpath)
+    size = image.shape[::-1][1:3]
+
+    calibrator = ImageCalibrator(data, size, removes_perspective, height)
+    if shows_stats:
+        calibrator.print_stats()
+    image = calibrator.calibrate(image)
+
     if saves_file:
         outpath = add_suffix_to_path(imgpath, SUFFIX)
         cv2.imwrite(outpath, image)
@@ -187,14 +319,357 @@ def main(data, saves_file=False, removes_perspective=True, shows_stats=False):
         show_image(image, scale=1.0/2, window_title='Undistorted Image')
 
 
+def find_images(pattern):
+    """Return paths to images in directory or matching glob pattern.
+
+    Arguments:
+    pattern (str) -- Path to directory or glob pattern.
+    """
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '*')
+    return sorted(path for path in glob(pattern)
+                  if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS and
+                  not os.path.splitext(path)[0].endswith(GENERATED_SUFFIXES))
+
+
+def batch_outpath(path, outdir=None):
+    """Return path to save calibrated image in batch.
+
+    Arguments:
+    path (str) -- Path to source image.
+    outdir (str) -- Directory to save results or None for the directory of
+                    the image.
+    """
+    outpath = add_suffix_to_path(path, SUFFIX)
+    if outdir:
+        outpath = os.path.join(outdir, os.path.basename(outpath))
+    return outpath
+
+
+def batch(paths, location_path=None, outdir=None, removes_perspective=True,
+          height=None, max_workers=None, queue_dir=None):
+    """Calibrate images sharing a location file in a thread pool.
+
+    Images that can't be read or differ in size from the first readable
+    image are skipped instead of aborting the batch.
+
+    Arguments:
+    paths ([str]) -- Paths to images of the same size.
+    location_path (str) -- Path to location file or None to find it next to
+                           the first image.
+    outdir (str) -- Directory to save results or None for the directory of
+                    each image.
+    removes_perspective (bool) -- Whether to also remove perspective.
+    height (float) -- Height of the plane to project on.
+    max_workers (int) -- Number of threads or None for the default.
+    queue_dir (str) -- Shared directory to claim images from, so that
+                       workers on several nodes split the batch, or None.
+
+    Return:
+    outpaths ([str]) -- Paths to the files created by this process.
+    skipped ([(str, str)]) -- Paths to the images skipped by this process
+                              and the reasons.
+    """
+    outpaths = {path: batch_outpath(path, outdir) for path in paths}
+    sources = {}
+    for path, outpath in outpaths.items():
+        if outpath in sources:
+            raise ValueError("Both {} and {} would be saved to {}."
+                             .format(sources[outpath], path, outpath))
+        sources[outpath] = path
+
+    # first readable image gives the size
+    for reference in paths:
+        image = cv2.imread(reference)
+        if image is not None:
+            break
+    else:
+        return [], [(path, "can't read image") for path in paths]
+    size = image.shape[1::-1]
+    with open(reference, 'rb') as f:
+        data = Data(f, loc_path=location_path)
+    calibrator = ImageCalibrator(data, size, removes_perspective, height,
+                                 max_workers=1)
+
+    def process(path):
+        """Return path to result or None and the reason of skip.
+        """
+        image = cv2.imread(path)
+        if image is None:
+            return None, "can't read image"
+        if image.shape[1::-1] != size:
+            return None, "size {}x{} differs from {}x{} of {}".format(
+                    *image.shape[1::-1], *size, reference)
+
+        outpath = outpaths[path]
+        if not cv2.imwrite(outpath, calibrator.calibrate(image)):
+            return None, "can't write {}".format(outpath)
+        return outpath, None
+
+    def collect(results):
+        created = sorted(outpath for outpath, _ in results if outpath)
+        skipped = [(path, reason) for path, (outpath, reason)
+                   in zip(paths, results) if not outpath]
+        return created, skipped
+
+    # OpenCV releases GIL while decoding, transforming and encoding
+    if not queue_dir:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return collect(list(executor.map(process, paths)))
+
+    # each thread claims images by path relative to their common directory
+    queue = WorkQueue(queue_dir)
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(path))
+                               for path in paths])
+    tasks = {quote(os.path.relpath(os.path.abspath(path), root), safe=''):
+             path for path in paths}
+    results = {}
+
+    def work():
+        for claim in queue.claims(list(tasks)):
+            path = tasks[claim.task]
+            try:
+                results[path] = process(path)
+            except BaseException:
+                claim.release()
+                raise
+            claim.complete()
+
+    max_workers = max_workers or os.cpu_count()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(work) for _ in range(max_workers)]
+        for future in futures:
+            future.result()
+
+    paths = [path for path in paths if path in results]
+    return collect([results[path] for path in paths])
+
+
+def is_video(path):
+    return os.path.splitext(path)[1].lower() in VIDEO_EXTENSIONS
+
+
+def load_mosaic_camera(image_path, location_path, camera_path, size):
+    """Fit undistorter and projector for a camera of mosaic.
+
+    Arguments:
+    image_path (str) -- Path to image or video of the camera.
+    location_path (str) -- Path to location file.
+    camera_path (str) -- Path to camera model file or NO_CAMERA.
+    size (int, int) -- Width and height of the camera image.
+    """
+    with open(image_path, 'rb') as f:
+        data = Data(f, loc_path=location_path)
+
+    if camera_path != NO_CAMERA:
+        with open(camera_path, 'rb') as f:
+            undistorter = Undistorter.load(f)
+    else:
+        undistorter = Undistorter.init(data.image_points, data.dest_points,
+                                       size)
+    undistorted_points = undistorter.calibrate_points(data.image_points)
+    projector = Projector(undistorted_points, data.dest_points)
+
+    return undistorter, projector
+
+
+def create_mosaic(camera_sets, width=None, height=None):
+    """Stitch images or videos of multiple cameras into a mosaic file.
+
+    Arguments:
+    camera_sets ([(str, str, str)]) -- Paths to image or video, location file
+                                       and camera model file of each camera.
+    width (int) -- Width of the mosaic in pixel.
+    height (float) -- Height of the plane to project on.
+
+    Return:
+    outpath (str) -- Path to the created file.
+    """
+    image_paths = [image_path for image_path, _, _ in camera_sets]
+    outpath = add_suffix_to_path(image_paths[0], MOSAIC_SUFFIX)
+
+    if is_video(image_paths[0]):
+        captures = [cv2.VideoCapture(path) for path in image_paths]
+        sizes = [(int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                  int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+                 for capture in captures]
+    else:
+        images = [cv2.imread(path) for path in image_paths]
+        sizes = [image.shape[1::-1] for image in images]
+
+    cameras = [load_mosaic_camera(*camera_set, size)
+               for camera_set, size in zip(camera_sets, sizes)]
+    mosaic = Mosaic(cameras, width=width, z=height)
+
+    if not is_video(image_paths[0]):
+        cv2.imwrite(outpath, mosaic.stitch(images))
+        return outpath
+
+    # reuse the maps and the frame buffer for every frame
+    fps = captures[0].get(cv2.CAP_PROP_FPS)
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    writer = cv2.VideoWriter(outpath, fourcc, fps, mosaic.size)
+    frame = None
+    try:
+        while True:
+            frames = []
+            for capture in captures:
+                found, image = capture.read()
+                if not found:
+                    return outpath
+                frames.append(image)
+            frame = mosaic.stitch(frames, out=frame)
+            writer.write(frame)
+    finally:
+        writer.release()
+        for capture in captures:
+            capture.release()
+
+
+class TestCase(unittest.TestCase):
+    dirname = 'test'
+
+    def test_project_image(self):
+        test_dir = os.path.join(os.path.dirname(__file__), self.dirname)
+        location_path = os.path.join(test_dir, 'Location.csv')
+        with open(location_path, 'rb') as f:
+            data = Data(f, loc_path=location_path)
+        projector = Projector(data.image_points, data.dest_points)
+        image = np.random.default_rng(0).integers(0, 256, (2160, 3840, 3),
+                                                  np.uint8)
+
+        (offset, extent), _ = estimate_clipping_rect(projector, (3840, 2160))
+        scale = 960 / extent[0]
+        size = (960, int(scale * extent[1]))
+        transform = np.array([
+            [scale, 0.0, -scale * offset[0]],
+            [0.0, scale, -scale * offset[1]],
+            [0.0, 0.0, 1.0]
+        ]) @ projector.homography_at(None)
+        expected = cv2.warpPerspective(image, transform, size,
+                                       borderMode=cv2.BORDER_CONSTANT)
+
+        # tiles warped in parallel match the whole image warped at once
+        out = projector.project_image(image, size, offset, scale=scale,
+                                      tile_height=37, max_workers=4)
+        np.testing.assert_array_equal(out, expected)
+
+        # buffer is reused regardless of the limit
+        out.fill(0)
+        result = projector.project_image(image, size, offset, scale=scale,
+                                         out=out, max_bytes=0)
+        self.assertIs(result, out)
+        np.testing.assert_array_equal(out, expected)
+
+        with self.assertRaises(MemoryError):
+            projector.project_image(image, size, offset, scale=scale,
+                                    max_bytes=out.nbytes - 1)
+
+    def test_mosaic(self):
+        test_dir = os.path.join(os.path.dirname(__file__), self.dirname)
+        location_path = os.path.join(test_dir, 'Location.csv')
+        with open(location_path, 'rb') as f:
+            data = Data(f, loc_path=location_path)
+        size = (3840, 2160)
+        undistorter = Undistorter.init(data.image_points, data.dest_points,
+                                       size)
+        projector = Projector(undistorter.calibrate_points(data.image_points),
+                              data.dest_points)
+
+        # smooth gradation not to compare interpolation of noise
+        ys, xs = np.mgrid[0:size[1], 0:size[0]]
+        image = np.dstack([xs * 255 // size[0], ys * 255 // size[1],
+                           (xs + ys) * 127 // size[1]]).astype(np.uint8)
+
+        # single camera is undistorted and projected in one remap
+        mosaic = Mosaic([(undistorter, projector)], width=960)
+        result = mosaic.stitch([image])
+        map_x, map_y = undistorter.undistort_maps()
+        expected = projector.project_image(
+                cv2.remap(image, map_x, map_y, cv2.INTER_LINEAR),
+                mosaic.size, mosaic.origin, scale=mosaic.scale)
+        self.assertEqual(result.shape, expected.shape)
+        self.assertLess(np.abs(result - expected.astype(int)).mean(), 0.5)
+
+        # overlapping cameras are blended into the same image
+        mosaic = Mosaic([(undistorter, projector)] * 2, width=960)
+        np.testing.assert_array_equal(mosaic.stitch([image, image]), result)
+
+    def test_batch(self):
+        test_dir = os.path.join(os.path.dirname(__file__), self.dirname)
+        location_path = os.path.join(test_dir, 'Location.csv')
+        image = np.random.default_rng(0).integers(0, 256, (2160, 3840, 3),
+                                                  np.uint8)
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            paths = []
+            for name in ('a', 'b'):
+                os.mkdir(os.path.join(dirpath, name))
+                paths.append(os.path.join(dirpath, name, 'frame.png'))
+                cv2.imwrite(paths[-1], image)
+            # broken image and output of another tool
+            broken_path = os.path.join(dirpath, 'a', 'broken.png')
+            with open(broken_path, 'wb') as f:
+                f.write(b'broken')
+            mosaic_path = os.path.join(dirpath, 'a', 'frame_mosaic.png')
+            cv2.imwrite(mosaic_path, image[:100])
+            self.assertEqual(find_images(os.path.join(dirpath, 'a')),
+                             [broken_path, paths[0]])
+
+            with open(paths[0], 'rb') as f:
+                main(Data(f, loc_path=location_path), saves_file=True)
+            expected = cv2.imread(add_suffix_to_path(paths[0], SUFFIX))
+
+            # images of the same name are distinguished in the queue
+            outpaths, skipped = batch(
+                    [broken_path] + paths + [mosaic_path], location_path,
+                    queue_dir=os.path.join(dirpath, 'queue'))
+            self.assertEqual(outpaths, [add_suffix_to_path(path, SUFFIX)
+                                        for path in paths])
+            self.assertEqual([path for path, _ in skipped],
+                             [broken_path, mosaic_path])
+            for outpath in outpaths:
+                np.testing.assert_array_equal(cv2.imread(outpath), expected)
+
+            # results must not overwrite each other in outdir
+            with self.assertRaises(ValueError):
+                batch(paths, location_path, os.path.join(dirpath, 'out'))
+
+
 if __name__ == "__main__":
     parser = ArgsParser()
     args = parser.parse_args()
 
     if args.test:
-        print("This script doesn't have test.")
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestCase)
+        unittest.TextTestRunner().run(suite)
+        sys.exit()
+
+    if args.mosaic:
+        print(create_mosaic(args.mosaic, args.width, args.height))
         sys.exit()
 
+    if args.batch:
+        paths = find_images(args.batch)
+        if not paths:
+            sys.exit("No images were found in {}.".format(args.batch))
+        if args.outdir:
+            os.makedirs(args.outdir, exist_ok=True)
+        try:
+            outpaths, skipped = batch(paths, args.location, args.outdir,
+                                      removes_perspective=args.perspective,
+                                      height=args.height,
+                                      max_workers=args.jobs,
+                                      queue_dir=args.queue)
+        except ValueError as error:
+            sys.exit(error)
+        for outpath in outpaths:
+            print(outpath)
+        for path, reason in skipped:
+            print("Skipped {}: {}".format(path, reason), file=sys.stderr)
+        sys.exit(1 if skipped else 0)
+
     data = Data(args.file, in_cols=args.in_cols)
     main(data, saves_file=args.save,
-         removes_perspective=args.perspective, shows_stats=args.stats)
+         removes_perspective=args.perspective, shows_stats=args.stats,
+         height=args.height)
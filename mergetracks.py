@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+Merge calibrated tracklogs of overlapping cameras into one.
+
+(C) 2026 1024jp
+"""
+
+import argparse
+import io
+import sys
+import unittest
+
+from modules import merging
+from modules.argsparser import output_file
+from modules.compression import open_text
+
+
+# constants
+DEFAULT_DISTANCE = 300  # in mm
+
+
+class TestCase(unittest.TestCase):
+
+    def test_merge(self):
+        camera_a = io.StringIO("id\ttime\tx\ty\n"
+                               "1\t0.5\t1000\t1000\n"
+                               "2\t0.5\t5000\t5000\n"
+                               "1\t1.0\t1100\t1000\n")
+        camera_b = io.StringIO("id\ttime\tx\ty\n"
+                               "7\t0.5\t1100\t1050\n"
+                               "8\t1.0\t9000\t9000\n")
+        out = io.StringIO()
+        merging.merge([camera_a, camera_b], out, DEFAULT_DISTANCE)
+
+        self.assertEqual(out.getvalue().splitlines(), [
+            "id\ttime\tx\ty\tcamera",
+            "1\t0.5\t1000\t1000\t0",
+            "2\t0.5\t5000\t5000\t0",
+            "1\t1.0\t1100\t1000\t0",
+            "8\t1.0\t9000\t9000\t1",
+        ])
+
+    def test_exact_duplicates(self):
+        camera_a = io.StringIO("1\t0.5\t1000\t1000\n")
+        camera_b = io.StringIO("7\t0.5\t1000\t1000\n"
+                               "8\t0.5\t1000\t1001\n")
+        out = io.StringIO()
+        merging.merge([camera_a, camera_b], out, 0)
+
+        self.assertEqual(out.getvalue().splitlines(), [
+            "1\t0.5\t1000\t1000\t0",
+            "8\t0.5\t1000\t1001\t1",
+        ])
+
+    def test_unsorted(self):
+        camera = io.StringIO("1\t1.0\t0\t0\n"
+                             "1\t0.5\t0\t0\n")
+        with self.assertRaises(ValueError):
+            merging.merge([camera], io.StringIO(), DEFAULT_DISTANCE)
+
+
+def parse_args():
+    """Parse command-line arguments.
+
+    Returns:
+    args (Namespace) -- namespace object contains parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+            description='Merge calibrated tracklogs of overlapping cameras.')
+
+    # argument
+    parser.add_argument('files',
+                        type=open_text,
+                        nargs='*',
+                        metavar='FILE',
+                        help="paths to calibrated tracklogs sorted by frame"
+                        )
+
+    parser.add_argument('-t', '--test',
+                        action='store_true',
+                        default=False,
+                        help="test the program"
+                        )
+    parser.add_argument('--out',
+                        type=output_file,
+                        default=sys.stdout,
+                        metavar='FILE',
+                        help="path to output file"
+                             " (default: display to standard output)"
+                        )
+
+    # optional arguments
+    options = parser.add_argument_group('merge options')
+    options.add_argument('-d', '--distance',
+                         type=float,
+                         default=DEFAULT_DISTANCE,
+                         metavar='MM',
+                         help=("distance in the real world to treat"
+                               " detections as the same object"
+                               " (default: %(default)s)")
+                         )
+    options.add_argument('--frame_col',
+                         type=int,
+                         default=merging.DEFAULT_FRAME_COLUMN,
+                         metavar='INDEX',
+                         help=("column position of frame in file"
+                               " (default: %(default)s)")
+                         )
+    options.add_argument('--in_cols',
+                         type=int,
+                         nargs=2,
+                         default=list(merging.DEFAULT_INPUT_COLUMNS),
+                         metavar='INDEX',
+                         help=("column positions of x, y in file"
+                               " (default: %(default)s)")
+                         )
+
+    args = parser.parse_args()
+    if not args.test and len(args.files) < 1:
+        parser.error('This script requires paths to tracklog files.')
+    if args.distance < 0:
+        parser.error('Distance must not be negative.')
+
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.test:
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestCase)
+        unittest.TextTestRunner().run(suite)
+        sys.exit()
+
+    try:
+        merging.merge(args.files, args.out, args.distance, args.frame_col,
+                      args.in_cols)
+    finally:
+        for file in args.files:
+            file.close()
+        if args.out is not sys.stdout:
+            args.out.close()
@@ -11,15 +11,34 @@ import logging
 import os
 import sys
 
+from .compression import open_text
+
 try:
     from . import __version__ as version
 except ImportError:
     version = 'n/a'
 
 
+def output_file(path):
+    """Open output file compressing by extension for argparse type.
+
+    Arguments:
+    path (str) -- Path to output file or '-' for standard output.
+    """
+    if path == '-':
+        return sys.stdout
+    try:
+        return open_text(path, 'w')
+    except (OSError, ImportError) as error:
+        raise argparse.ArgumentTypeError(
+                "can't open '{}': {}".format(path, error))
+
+
 class Parser(argparse.ArgumentParser):
     description = 'Translate coordinates in a picture to the real world.'
     datafile_name = 'source'
+    datafile_required = True
+    opens_output = True  # False to get path of output file instead
 
     def __init__(self):
         argparse.ArgumentParser.__init__(self, description=self.description)
@@ -55,10 +74,11 @@ class Parser(argparse.ArgumentParser):
 
         output = self.add_argument_group('output options')
         output.add_argument('--out',
-                            type=argparse.FileType('w'),
+                            type=output_file if self.opens_output else str,
                             default=sys.stdout,
                             metavar='FILE',
-                            help="path to output file"
+                            help="path to output file, compressed if it ends"
+                                 " with .gz or .zst"
                                  " (default: display to standard output)"
                             )
 
@@ -135,7 +155,7 @@ class Parser(argparse.ArgumentParser):
         if len(kwargs) > 0:
             return args
 
-        if not args.test and not args.file:
+        if self.datafile_required and not args.test and not args.file:
             self.error('This script requires a path to a {} file.\n'.format(
                     self.datafile_name))
 
@@ -157,7 +177,7 @@ def display(args):
     """
     print('[arguments]')
     for key, arg in vars(args).items():
-        if isinstance(arg, io.IOBase):
+        if isinstance(arg, io.IOBase) or hasattr(arg, 'name'):
             arg = arg.name
         print('    {:10s} {}'.format(key + ':', arg))
 
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+Checkpoint of a long-running translation to resume it later.
+
+(C) 2026 1024jp
+"""
+
+import hashlib
+import os
+import pickle
+import time
+
+
+# constants
+DEFAULT_INTERVAL = 60  # in seconds
+SUFFIX = ".checkpoint"
+
+
+def fingerprint(*components):
+    """Return digest identifying the models and settings of a run.
+
+    Arguments:
+    components -- Bytes, NumPy arrays or objects with stable repr.
+    """
+    digest = hashlib.sha1()
+    for component in components:
+        if hasattr(component, 'tobytes'):
+            component = component.tobytes()
+        elif not isinstance(component, bytes):
+            component = repr(component).encode('utf-8')
+        digest.update(len(component).to_bytes(8, 'little'))
+        digest.update(component)
+    return digest.hexdigest()
+
+
+class Checkpoint:
+    def __init__(self, path, fingerprint, interval=DEFAULT_INTERVAL):
+        """Initialize checkpoint of a run from the beginning.
+
+        Arguments:
+        path (str) -- Path to checkpoint file.
+        fingerprint (str) -- Digest of the models and settings of the run.
+        interval (float) -- Interval in seconds to save checkpoint.
+        """
+        self.path = path
+        self.fingerprint = fingerprint
+        self.interval = interval
+        self.input_offset = 0
+        self.output_offset = 0
+        self.models = None
+        self._last_save = time.monotonic()
+
+    @classmethod
+    def load(cls, path, fingerprint, interval=DEFAULT_INTERVAL):
+        """Load checkpoint or create new one if no checkpoint file exists.
+
+        Arguments:
+        path (str) -- Path to checkpoint file.
+        fingerprint (str) -- Digest of the models and settings of the run.
+        interval (float) -- Interval in seconds to save checkpoint.
+        """
+        checkpoint = cls(path, fingerprint, interval)
+        if not os.path.exists(path):
+            return checkpoint
+
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        if state['fingerprint'] != fingerprint:
+            raise ValueError("Checkpoint {} was made with other models or"
+                             " settings.".format(path))
+        checkpoint.input_offset = state['input_offset']
+        checkpoint.output_offset = state['output_offset']
+        checkpoint.models = state['models']
+        return checkpoint
+
+    @property
+    def is_due(self):
+        return time.monotonic() - self._last_save >= self.interval
+
+    def save(self, input_offset, output_offset):
+        """Record offsets up to which the output is complete.
+
+        Arguments:
+        input_offset (int) -- Byte offset of the next row in input file.
+        output_offset (int) -- Byte offset of the end of flushed output.
+        """
+        self.input_offset = input_offset
+        self.output_offset = output_offset
+        state = {
+            'fingerprint': self.fingerprint,
+            'input_offset': input_offset,
+            'output_offset': output_offset,
+            'models': self.models,
+        }
+
+        # replace atomically not to leave a broken checkpoint
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            pickle.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        self._last_save = time.monotonic()
+
+    def remove(self):
+        """Remove checkpoint file after the run completed.
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+"""
+Text file I/O with transparent compression detected from file extension.
+
+Compressed files are (de)compressed in a background thread connected with a
+bounded queue, so that the (de)compression overlaps with the processing in
+the main thread.
+
+(C) 2026 1024jp
+"""
+
+import codecs
+import gzip
+import os
+import queue
+import threading
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# constants
+BLOCK_SIZE = 1 << 20  # size of a chunk passed between threads
+QUEUE_SIZE = 8  # number of chunks buffered between threads
+ENCODING = 'utf-8'
+GZIP_LEVEL = 6
+_FLUSH = object()  # marker to flush compressor in the writer thread
+
+
+def compression_of(path):
+    """Return compression format name for path or None if uncompressed.
+
+    Arguments:
+    path (str) -- File path.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    return {'.gz': 'gzip', '.zst': 'zstd'}.get(extension)
+
+
+def open_text(path, mode='r'):
+    """Open text file decompressing or compressing it if needed.
+
+    Arguments:
+    path (str) -- File path.
+    mode (str) -- 'r' to read or 'w' to write.
+    """
+    compression = compression_of(path)
+    if not compression:
+        return open(path, mode)
+
+    if compression == 'zstd' and zstandard is None:
+        raise ImportError("Reading and writing .zst files requires"
+                          " the zstandard module.")
+
+    if 'w' in mode:
+        return ThreadedWriter(path, compression)
+    return ThreadedReader(path, compression)
+
+
+def _open_stream(path, compression, mode):
+    raw = open(path, mode + 'b')
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=raw, mode=mode + 'b',
+                             compresslevel=GZIP_LEVEL), raw
+    if 'w' in mode:
+        compressor = zstandard.ZstdCompressor(threads=-1)
+        return compressor.stream_writer(raw, closefd=False), raw
+    return _ZstdReader(raw), raw
+
+
+class _ZstdReader:
+    def __init__(self, raw):
+        """Decompress concatenated zstd frames from raw file.
+
+        Unlike ZstdDecompressor.stream_reader(), a truncated frame raises
+        EOFError as gzip does instead of ending silently.
+        """
+        self._raw = raw
+        self._decompressor = None
+
+    def read(self, size):
+        while True:
+            chunk = self._raw.read(size)
+            if not chunk:
+                if self._decompressor and not self._decompressor.eof:
+                    raise EOFError("Compressed file ended before the end of"
+                                   " the zstd frame was reached")
+                return b''
+
+            data = b''
+            while chunk:
+                if self._decompressor is None or self._decompressor.eof:
+                    self._decompressor = (zstandard.ZstdDecompressor()
+                                          .decompressobj())
+                data += self._decompressor.decompress(chunk)
+                chunk = self._decompressor.unused_data
+            if data:
+                return data
+
+    def close(self):
+        pass
+
+
+class ThreadedReader:
+    def __init__(self, path, compression):
+        """Start decompressing file in a background thread.
+
+        Arguments:
+        path (str) -- Path to compressed file.
+        compression (str) -- Compression format.
+        """
+        self.name = path
+        self._queue = queue.Queue(QUEUE_SIZE)
+        self._error = None
+        self._closed = threading.Event()
+        self._stream, self._raw = _open_stream(path, compression, 'r')
+        self._thread = threading.Thread(target=self._read, daemon=True)
+        self._thread.start()
+        self._lines = self._iter_lines()
+
+    def _read(self):
+        try:
+            while not self._closed.is_set():
+                block = self._stream.read(BLOCK_SIZE)
+                self._put(block)
+                if not block:
+                    break
+        except Exception as error:
+            self._error = error
+            self._put(b'')
+
+    def _put(self, block):
+        while not self._closed.is_set():
+            try:
+                self._queue.put(block, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _iter_lines(self):
+        decoder = codecs.getincrementaldecoder(ENCODING)()
+        remainder = ''
+        while True:
+            block = self._queue.get()
+            if self._error:
+                raise self._error
+            text = remainder + decoder.decode(block, final=not block)
+            if not block:
+                break
+            lines = text.split('\n')
+            remainder = lines.pop()
+            for line in lines:
+                yield line + '\n'
+        if text:
+            yield text
+
+    def __iter__(self):
+        return self._lines
+
+    def readline(self):
+        return next(self._lines, '')
+
+    def close(self):
+        self._closed.set()
+        self._thread.join()
+        self._stream.close()
+        self._raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ThreadedWriter:
+    def __init__(self, path, compression):
+        """Start compressing into file in a background thread.
+
+        Arguments:
+        path (str) -- Path to compressed file.
+        compression (str) -- Compression format.
+        """
+        self.name = path
+        self.compression = compression
+        self._queue = queue.Queue(QUEUE_SIZE)
+        self._error = None
+        self._buffer = []
+        self._buffered = 0
+        self.closed = False
+        self._stream, self._raw = _open_stream(path, compression, 'w')
+        self._thread = threading.Thread(target=self._write, daemon=True)
+        self._thread.start()
+
+    def _write(self):
+        while True:
+            block = self._queue.get()
+            try:
+                if block is None:
+                    break
+                if self._error:
+                    continue  # drain queue
+                if block is _FLUSH:
+                    self._flush_stream()
+                else:
+                    self._stream.write(block)
+            except Exception as error:
+                self._error = error
+            finally:
+                self._queue.task_done()
+
+    def _flush_stream(self):
+        # end the current compressed block so that readers get all data
+        if self.compression == 'gzip':
+            self._stream.flush(zlib.Z_SYNC_FLUSH)
+        else:
+            self._stream.flush(zstandard.FLUSH_BLOCK)
+        self._raw.flush()
+
+    def _send(self):
+        if self._buffer:
+            self._queue.put(''.join(self._buffer).encode(ENCODING))
+            self._buffer = []
+            self._buffered = 0
+
+    def write(self, text):
+        if self._error:
+            raise self._error
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if self._buffered >= BLOCK_SIZE:
+            self._send()
+        return len(text)
+
+    def flush(self):
+        """Write buffered text through the compressor into the file.
+
+        This waits for the writer thread and ends the current compressed
+        block, so call it only when the output must be readable right away.
+        """
+        self._send()
+        self._queue.put(_FLUSH)
+        self._queue.join()
+        if self._error:
+            raise self._error
+
+    def close(self):
+        if self.closed:
+            return
+        self._send()
+        self._queue.put(None)
+        self._thread.join()
+        self.closed = True
+        self._stream.close()
+        self._raw.close()
+        if self._error:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -6,13 +6,95 @@ Datafile object for tracklog and Loc file.
 """
 
 import csv
+import io
 import os
+import uuid
+from itertools import chain, islice
+
+import numpy as np
+
+from .compression import ENCODING, compression_of, open_text
+from .follow import DEFAULT_LATENCY, follow_lines
 
 
 # constants
 LOC_FILENAME = "Location.csv"
 DEFAULT_INPUT_COLUMNS = (2, 3)
 FIND_LEVEL = 3  # number of parent directories to find in.
+BATCH_SIZE = 65536  # number of rows translated at once
+LOC_COLUMNS = 5  # x, y, z in the real world and x, y in image
+CACHE_FORMAT = ".{}.npy"  # binary cache of location file
+
+_found_paths = {}  # memo of _find_file() per directory
+_locations = {}  # memo of load_location() per path and mtime
+
+
+def load_location(path):
+    """Load location definition file into a 2D array.
+
+    The parsed array is stored in a binary cache next to the file as well as
+    in memory, and both are invalidated when the file is modified.
+
+    Arguments:
+    path (str) -- Path to location file.
+
+    Returns:
+    locations (numpy.array) -- Nx5 array of x, y, z in the real world and
+                               corresponding x, y in image.
+    """
+    mtime = os.stat(path).st_mtime_ns
+    key = os.path.abspath(path)
+    cached = _locations.get(key)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    cache_path = os.path.join(os.path.dirname(path),
+                              CACHE_FORMAT.format(os.path.basename(path)))
+    try:
+        if os.stat(cache_path).st_mtime_ns != mtime:
+            raise FileNotFoundError
+        locations = np.load(cache_path)
+    except (OSError, ValueError):
+        locations = _parse_location(path)
+        _save_cache(cache_path, locations, mtime)
+
+    locations.flags.writeable = False
+    _locations[key] = (mtime, locations)
+    return locations
+
+
+def _save_cache(cache_path, locations, mtime):
+    """Save binary cache of location file marked with the mtime of the file.
+
+    The cache is written to a temporary file first so that other processes
+    never load an incomplete cache.
+    """
+    temp_path = '{}.tmp-{}'.format(cache_path, uuid.uuid4().hex)
+    try:
+        with open(temp_path, 'wb') as f:
+            np.save(f, locations)
+        os.utime(temp_path, ns=(mtime, mtime))
+        os.replace(temp_path, cache_path)
+    except OSError:
+        # cache is optional
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+
+def _parse_location(path):
+    """Parse location file skipping header, comment and incomplete rows.
+    """
+    with open(path, 'r') as f:
+        # remove quotes around cells as csv reader does
+        lines = (line.replace('"', '') for line in f)
+        lines = [line for line in lines
+                 if line.count(',') >= LOC_COLUMNS - 1 and
+                 line[:1] not in ('#', ',') and not line[:1].isalpha()]
+
+    return np.loadtxt(lines, delimiter=',', usecols=range(LOC_COLUMNS),
+                      ndmin=2).reshape(-1, LOC_COLUMNS)
 
 
 class Data:
@@ -49,43 +131,35 @@ class Data:
         filename (str) -- filename.
         subdirectory (str) -- directory where file is located.
         """
+        key = (self.dirpath, filename, subdirectory)
+        if key in _found_paths:
+            return _found_paths[key]
+
         paths = []
         dirpath = self.dirpath
         for _ in range(FIND_LEVEL):
             components = [dirpath, filename]
             if subdirectory:
-                components.insert(subdirectory)
+                components.insert(1, subdirectory)
             path = os.path.join(*components)
             if os.path.exists(path):
                 paths.append(path)
             dirpath = os.path.dirname(dirpath)
 
+        _found_paths[key] = paths
         return paths
 
     def _load_location(self):
         """Load location definition file.
 
         Returns:
-        image_points -- x,y pairs of reference points in image.
-        dest_points -- corresponding x,y,z pairs of ref points in field.
+        image_points (numpy.array) -- x,y pairs of reference points in image.
+        dest_points (numpy.array) -- corresponding x,y,z pairs of ref points
+                                     in field.
         """
-        image_points = []
-        dest_points = []
-        with open(self.loc_path, 'r') as f:
-            reader = csv.reader(f, delimiter=',')
-            for row in reader:
-                if len(row) < 4:
-                    continue
-                first_char = row[0][0]
-                if first_char.isalpha() or first_char == '#':
-                    continue
-                row = list(map(float, row))
-                image_point = row[3:5]
-                dest_point = row[0:3]
-                image_points.append(image_point)
-                dest_points.append(dest_point)
+        locations = load_location(self.loc_path)
 
-        return image_points, dest_points
+        return locations[:, 3:5], locations[:, 0:3]
 
     def file_named(self, filename, exists=False):
         path = os.path.join(self.dirpath, filename)
@@ -97,12 +171,12 @@ class Data:
         in_cols = self.in_cols
         out_cols = self.out_cols
 
-        with open(self.datafile.name) as file_in:
+        with open_text(self.datafile.name) as file_in:
             # detect delimiter
-            dialect = csv.Sniffer().sniff(file_in.readline(), delimiters=',\t')
-            file_in.seek(0)
+            first_line = file_in.readline()
+            dialect = csv.Sniffer().sniff(first_line, delimiters=',\t')
 
-            reader = csv.reader(file_in, dialect)
+            reader = csv.reader(chain([first_line], file_in), dialect)
             writer = csv.writer(output, dialect)
 
             for row in reader:
@@ -129,3 +203,203 @@ class Data:
                 new_row[out_cols[1]] = int(y)
 
                 writer.writerow(new_row)
+
+    def process_coordinate_batches(self, batch_handler, output,
+                                   batch_size=BATCH_SIZE, checkpoint=None,
+                                   progress_handler=None):
+        """Translate coordinates in data file by chunks of rows.
+
+        Arguments:
+        batch_handler (function) -- Function taking Nx2 array of x,y and
+                                    N array of z (NaN for none) and returning
+                                    Nx2 array of translated x,y.
+        output (file) -- File-like object to write result.
+        batch_size (int) -- Number of rows to translate at once.
+        checkpoint (Checkpoint) -- Checkpoint to start from and to save
+                                   progress periodically, or None.
+        progress_handler (function) -- Function called after each batch with
+                                       the number of rows processed so far.
+        """
+        if checkpoint:
+            self._process_from_checkpoint(batch_handler, output, batch_size,
+                                          checkpoint)
+            return
+
+        with open_text(self.datafile.name) as file_in:
+            # detect delimiter
+            first_line = file_in.readline()
+            dialect = csv.Sniffer().sniff(first_line, delimiters=',\t')
+
+            reader = csv.reader(chain([first_line], file_in), dialect)
+            writer = csv.writer(output, dialect)
+
+            rows = []
+            count = 0
+            for row in reader:
+                rows.append(row)
+                if len(rows) >= batch_size:
+                    self._translate_rows(rows, batch_handler, writer)
+                    count += len(rows)
+                    rows = []
+                    if progress_handler:
+                        progress_handler(count)
+            self._translate_rows(rows, batch_handler, writer)
+            if progress_handler:
+                progress_handler(count + len(rows))
+
+    def _process_from_checkpoint(self, batch_handler, output, batch_size,
+                                 checkpoint):
+        if compression_of(self.datafile.name):
+            raise ValueError("Checkpoint requires uncompressed source file.")
+
+        # read in binary to know the byte offsets of rows
+        with open(self.datafile.name, 'rb') as file_in:
+            # detect delimiter
+            first_line = file_in.readline().decode(ENCODING)
+            dialect = csv.Sniffer().sniff(first_line, delimiters=',\t')
+            file_in.seek(checkpoint.input_offset)
+
+            writer = csv.writer(output, dialect)
+            while True:
+                lines = list(islice(file_in, batch_size))
+                if not lines:
+                    break
+                rows = list(csv.reader([line.decode(ENCODING)
+                                        for line in lines], dialect))
+                self._translate_rows(rows, batch_handler, writer)
+
+                if checkpoint.is_due:
+                    # output must reach the disk before the checkpoint does
+                    output.flush()
+                    try:
+                        os.fsync(output.fileno())
+                    except io.UnsupportedOperation:
+                        pass  # in-memory stream
+                    checkpoint.save(file_in.tell(), output.tell())
+
+    def process_coordinate_range(self, batch_handler, output, start=0,
+                                 end=None, batch_size=BATCH_SIZE,
+                                 progress_handler=None):
+        """Translate coordinates in rows starting in a byte range.
+
+        Adjacent ranges can be processed independently, since a row crossing
+        the boundary belongs to the range it starts in.
+
+        Arguments:
+        batch_handler (function) -- Function taking Nx2 array of x,y and
+                                    N array of z (NaN for none) and returning
+                                    Nx2 array of translated x,y.
+        output (file) -- File-like object to write result.
+        start (int) -- Byte offset of the range.
+        end (int) -- Byte offset of the end of the range or None for EOF.
+        batch_size (int) -- Number of rows to translate at once.
+        progress_handler (function) -- Function called after each batch with
+                                       the byte offset of the next row.
+        """
+        if compression_of(self.datafile.name):
+            if start or end is not None:
+                raise ValueError("Byte range requires uncompressed source"
+                                 " file.")
+            self.process_coordinate_batches(
+                    batch_handler, output, batch_size,
+                    progress_handler=progress_handler)
+            return
+
+        with open(self.datafile.name, 'rb') as file_in:
+            # detect delimiter
+            first_line = file_in.readline().decode(ENCODING)
+            dialect = csv.Sniffer().sniff(first_line, delimiters=',\t')
+
+            # skip the row that started in the previous range
+            offset = start
+            if start > 0:
+                file_in.seek(start - 1)
+                offset += len(file_in.readline()) - 1
+            else:
+                file_in.seek(0)
+
+            writer = csv.writer(output, dialect)
+            finished = False
+            while not finished:
+                lines = []
+                while len(lines) < batch_size:
+                    if end is not None and offset >= end:
+                        finished = True
+                        break
+                    line = file_in.readline()
+                    if not line:
+                        finished = True
+                        break
+                    offset += len(line)
+                    lines.append(line.decode(ENCODING))
+
+                rows = list(csv.reader(lines, dialect))
+                self._translate_rows(rows, batch_handler, writer)
+                if progress_handler:
+                    progress_handler(offset)
+
+    def follow_coordinates(self, batch_handler, output,
+                           latency=DEFAULT_LATENCY, idle_timeout=None):
+        """Translate coordinates in data file appended while recording.
+
+        Arguments:
+        batch_handler (function) -- Function taking Nx2 array of x,y and
+                                    N array of z (NaN for none) and returning
+                                    Nx2 array of translated x,y.
+        output (file) -- File-like object to write result.
+        latency (float) -- Maximum delay in seconds to output appended rows.
+        idle_timeout (float) -- Stop after no row was appended for the
+                                seconds, or None to follow forever.
+        """
+        if compression_of(self.datafile.name):
+            raise ValueError("Compressed file can't be followed.")
+
+        dialect = None
+        writer = None
+        for lines in follow_lines(self.datafile.name, latency, idle_timeout):
+            # detect delimiter
+            if not dialect:
+                dialect = csv.Sniffer().sniff(lines[0], delimiters=',\t')
+                writer = csv.writer(output, dialect)
+
+            rows = list(csv.reader(lines, dialect))
+            self._translate_rows(rows, batch_handler, writer)
+            output.flush()
+
+    def _translate_rows(self, rows, batch_handler, writer):
+        in_cols = self.in_cols
+        out_cols = self.out_cols
+
+        indexes = []
+        points = []
+        zs = []
+        for index, row in enumerate(rows):
+            try:
+                point = (float(row[in_cols[0]]), float(row[in_cols[1]]))
+            except ValueError:  # leave row as is if not number
+                continue
+
+            z = np.nan
+            if self.z_col:
+                try:
+                    z = float(row[self.z_col])
+                except ValueError:
+                    pass
+
+            indexes.append(index)
+            points.append(point)
+            zs.append(z)
+
+        if points:
+            # translate
+            results = batch_handler(np.array(points), np.array(zs))
+            # leave row as is if not translatable, such as NaN for lost target
+            finite = np.isfinite(results).all(axis=1)
+            indexes = np.array(indexes)[finite].tolist()
+            results = results[finite].astype(int).tolist()
+            for index, (x, y) in zip(indexes, results):
+                row = rows[index]
+                row[out_cols[0]] = x
+                row[out_cols[1]] = y
+
+        writer.writerows(rows)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Render displacement of lens undistortion into an image.
+
+(C) 2026 1024jp
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+
+# constants
+ARROW_INTERVAL = 100  # in pixel of the source image
+ARROW_COLOR = (255, 255, 255)
+
+
+def render_map(undistorter, interval=1, max_magnitude=None,
+               arrow_interval=ARROW_INTERVAL):
+    """Draw displacement magnitude in color with arrows on top.
+
+    Arguments:
+    undistorter (Undistorter) -- Camera model to visualize.
+    interval (int) -- Sampling interval of the map in pixel.
+    max_magnitude (float) -- Displacement mapped to the hottest color,
+                             or None to use the maximum in the map.
+    arrow_interval (int) -- Interval between arrows in pixel, or 0 for none.
+
+    Returns:
+    image (numpy.array) -- BGR image of the map.
+    """
+    field = undistorter.displacement_field(interval)
+    magnitude = np.hypot(field[..., 0], field[..., 1])
+
+    if max_magnitude is None:
+        max_magnitude = magnitude.max()
+    scale = 255.0 / max_magnitude if max_magnitude > 0 else 0
+    levels = cv2.convertScaleAbs(magnitude, alpha=scale)
+    image = cv2.applyColorMap(levels, cv2.COLORMAP_JET)
+
+    # draw arrows from distorted points to undistorted ones
+    step = arrow_interval // interval
+    if step > 0:
+        thickness = max(1, image.shape[1] // 1000)
+        for row in range(step // 2, field.shape[0], step):
+            for col in range(step // 2, field.shape[1], step):
+                dx, dy = field[row, col] / interval
+                start = (int(col - dx), int(row - dy))
+                cv2.arrowedLine(image, start, (col, row), ARROW_COLOR,
+                                thickness=thickness, tipLength=0.2)
+
+    return image
+
+
+def save_map(undistorter, path, **kwargs):
+    """Render displacement map and write it to an image file.
+
+    Arguments:
+    undistorter (Undistorter) -- Camera model to visualize.
+    path (str) -- Path to the image file to write.
+    kwargs -- Options passed to render_map().
+    """
+    image = render_map(undistorter, **kwargs)
+    if not cv2.imwrite(path, image):
+        raise IOError("Failed writing image to {}".format(path))
+    return path
+
+
+def save_maps(jobs, max_workers=None, **kwargs):
+    """Render displacement maps of multiple camera models in parallel.
+
+    Arguments:
+    jobs ([(Undistorter, str)]) -- Pairs of camera model and output path.
+    max_workers (int) -- Number of threads or None for the default.
+    kwargs -- Options passed to render_map().
+
+    Returns:
+    paths ([str]) -- Paths to the written files in the order of jobs.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(save_map, undistorter, path, **kwargs)
+                   for undistorter, path in jobs]
+        return [future.result() for future in futures]
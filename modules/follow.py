@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""
+Follow a growing text file and iterate appended complete lines.
+
+(C) 2026 1024jp
+"""
+
+import os
+import time
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+
+# constants
+DEFAULT_LATENCY = 0.2  # in seconds
+MAX_BATCH_LINES = 4096
+READ_SIZE = 1 << 16
+ENCODING = 'utf-8'
+
+
+class Watcher:
+    def __init__(self, path, interval):
+        """Wait for changes in the directory of path.
+
+        inotify is used if inotify_simple is available, otherwise the
+        watcher simply sleeps for the interval.
+
+        Arguments:
+        path (str) -- Path to the file to watch.
+        interval (float) -- Maximum time to wait in seconds.
+        """
+        self.interval = interval
+        self._inotify = None
+        if inotify_simple:
+            flags = inotify_simple.flags
+            self._inotify = inotify_simple.INotify()
+            self._inotify.add_watch(os.path.dirname(os.path.abspath(path)),
+                                    flags.MODIFY | flags.CREATE |
+                                    flags.MOVED_TO | flags.DELETE)
+
+    def wait(self):
+        if self._inotify:
+            self._inotify.read(timeout=int(1000 * self.interval))
+        else:
+            time.sleep(self.interval)
+
+    def close(self):
+        if self._inotify:
+            self._inotify.close()
+
+
+def follow_lines(path, latency=DEFAULT_LATENCY, idle_timeout=None,
+                 from_start=True):
+    """Iterate batches of complete lines appended to file.
+
+    A trailing line without line ending is kept back until it is completed.
+    When the file is replaced (rotated), the rest of the old file is read
+    before continuing with the new one from its beginning. When the file is
+    truncated, reading restarts from the beginning.
+
+    Arguments:
+    path (str) -- Path to the file to follow.
+    latency (float) -- Maximum delay in seconds to notice appended data.
+    idle_timeout (float) -- Stop after no data was appended for the seconds,
+                            or None to follow forever.
+    from_start (bool) -- Whether to read the existing content first.
+
+    Yields:
+    lines ([str]) -- Complete lines with line endings.
+    """
+    watcher = Watcher(path, latency / 2)
+    file = _wait_open(path, watcher)
+    if not from_start:
+        file.seek(0, os.SEEK_END)
+    remainder = b''
+    last_update = time.monotonic()
+
+    try:
+        while True:
+            block = file.read(READ_SIZE)
+            if block:
+                last_update = time.monotonic()
+                lines = (remainder + block).split(b'\n')
+                remainder = lines.pop()
+                for start in range(0, len(lines), MAX_BATCH_LINES):
+                    yield [line.decode(ENCODING) + '\n'
+                           for line in lines[start:start + MAX_BATCH_LINES]]
+                continue
+
+            # reached the end of the file
+            if _is_replaced(file, path):
+                try:
+                    new_file = open(path, 'rb')
+                except FileNotFoundError:
+                    pass  # moved away again
+                else:
+                    file.close()
+                    file = new_file
+                    remainder = b''
+                    continue
+            if os.fstat(file.fileno()).st_size < file.tell():  # truncated
+                file.seek(0)
+                remainder = b''
+                continue
+
+            if (idle_timeout is not None and
+                    time.monotonic() - last_update > idle_timeout):
+                break
+            watcher.wait()
+    finally:
+        file.close()
+        watcher.close()
+
+
+def _is_replaced(file, path):
+    """Return whether path points to another file than the opened one.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return False
+    current = os.fstat(file.fileno())
+    return (stat.st_ino, stat.st_dev) != (current.st_ino, current.st_dev)
+
+
+def _wait_open(path, watcher):
+    while True:
+        try:
+            return open(path, 'rb')
+        except FileNotFoundError:
+            watcher.wait()
@@ -0,0 +1,356 @@
+#!/usr/bin/env python
+"""
+Work queue on a shared filesystem for processing jobs on multiple nodes.
+
+Workers claim a task by creating its lock file exclusively and keep the lock
+alive by touching it. A lock that was not touched for a while is regarded as
+left by a dead worker and can be taken over. A finished task leaves a done
+marker, so workers on any node can join or leave at any time.
+
+The manifest is a JSON file like:
+
+    {
+        "shard_size": 67108864,
+        "jobs": [
+            {"input": "cam1/tracklog.tsv", "output": "cam1/world.tsv",
+             "location": "cam1/Location.csv", "camera": "cam1.model"},
+            {"input": "cam2/tracklog.tsv.gz", "output": "cam2/world.tsv.gz",
+             "shards": [[0, null]]}
+        ]
+    }
+
+Relative paths are resolved from the directory of the manifest. Jobs are
+split into byte-range shards of shard_size unless the shards are listed
+explicitly. A shard covers the rows starting in its range. Compressed
+sources can't be split and are processed as a single shard.
+
+The shard plan, locks, done markers, output parts and cached models are
+kept in the work directory next to the manifest. Remove it to process the
+jobs again.
+
+(C) 2026 1024jp
+"""
+
+import json
+import os
+import shutil
+import socket
+import time
+import uuid
+
+from .compression import compression_of
+
+
+# constants
+DEFAULT_SHARD_SIZE = 64 << 20  # in bytes
+DEFAULT_STALE_TIMEOUT = 120  # in seconds
+HEARTBEAT_INTERVAL = 10  # in seconds
+POLL_INTERVAL = 2  # in seconds
+WORK_SUFFIX = ".work"
+PLAN_FILENAME = "plan.json"
+
+
+class Claim:
+    def __init__(self, queue, task, token):
+        self.queue = queue
+        self.task = task
+        self.token = token  # content of the lock file written by this claim
+        self._last_beat = time.monotonic()
+
+    @property
+    def is_owned(self):
+        """Whether the lock is still the one of this claim.
+        """
+        try:
+            with open(self.queue.path(self.task, '.lock')) as f:
+                return f.read() == self.token
+        except FileNotFoundError:
+            return False
+
+    def heartbeat(self, *args):
+        """Tell other workers that the task is still in progress.
+        """
+        if time.monotonic() - self._last_beat < HEARTBEAT_INTERVAL:
+            return
+        if self.is_owned:
+            os.utime(self.queue.path(self.task, '.lock'))
+        self._last_beat = time.monotonic()
+
+    def complete(self):
+        """Mark the task done and release the lock.
+        """
+        fd = os.open(self.queue.path(self.task, '.done'),
+                     os.O_CREAT | os.O_WRONLY, 0o644)
+        os.close(fd)
+        self.release()
+
+    def release(self):
+        """Give up the task so that other workers can claim it.
+
+        The lock is left as is if another worker has taken it over.
+        """
+        lock_path = self.queue.path(self.task, '.lock')
+
+        # move lock aside first not to remove the one of another worker
+        moved_path = '{}.release-{}'.format(lock_path, uuid.uuid4().hex)
+        try:
+            os.rename(lock_path, moved_path)
+        except FileNotFoundError:
+            return
+        with open(moved_path) as f:
+            if f.read() != self.token:
+                try:
+                    os.link(moved_path, lock_path)
+                except FileExistsError:
+                    pass
+        os.remove(moved_path)
+
+
+class WorkQueue:
+    def __init__(self, directory, stale_timeout=DEFAULT_STALE_TIMEOUT):
+        """Initialize work queue in a shared directory.
+
+        Arguments:
+        directory (str) -- Directory for lock files and done markers.
+        stale_timeout (float) -- Seconds after which an untouched lock is
+                                 regarded as left by a dead worker.
+        """
+        self.directory = directory
+        self.stale_timeout = stale_timeout
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, task, suffix=''):
+        return os.path.join(self.directory, task + suffix)
+
+    def is_done(self, task):
+        return os.path.exists(self.path(task, '.done'))
+
+    def claim(self, task):
+        """Try to claim task.
+
+        Returns:
+        claim (Claim) -- Claim of the task or None if done or taken.
+        """
+        if self.is_done(task):
+            return None
+
+        lock_path = self.path(task, '.lock')
+        for _ in range(2):
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY,
+                             0o644)
+            except FileExistsError:
+                if not self._take_over_stale(lock_path):
+                    return None
+                continue
+
+            token = '{} {} {}\n'.format(socket.gethostname(), os.getpid(),
+                                        uuid.uuid4().hex)
+            with os.fdopen(fd, 'w') as f:
+                f.write(token)
+            claim = Claim(self, task, token)
+
+            # the task may have been completed just before claiming
+            if self.is_done(task):
+                claim.release()
+                return None
+            return claim
+
+        return None
+
+    def _take_over_stale(self, lock_path):
+        """Remove lock if stale and return whether it was removed.
+        """
+        try:
+            if time.time() - os.stat(lock_path).st_mtime < self.stale_timeout:
+                return False
+
+            # rename first so that only one worker removes the lock
+            stale_path = '{}.stale-{}'.format(lock_path, uuid.uuid4().hex)
+            os.rename(lock_path, stale_path)
+        except FileNotFoundError:
+            return True  # released meanwhile
+
+        if time.time() - os.stat(stale_path).st_mtime < self.stale_timeout:
+            # another worker took it over just before: put it back
+            try:
+                os.link(stale_path, lock_path)
+            except FileExistsError:
+                pass
+            os.remove(stale_path)
+            return False
+
+        os.remove(stale_path)
+        return True
+
+    def claims(self, tasks, waits=True):
+        """Iterate claims of tasks until all tasks are done.
+
+        Arguments:
+        tasks ([str]) -- Task names.
+        waits (bool) -- Whether to wait for tasks claimed by other workers
+                        to be done or to become stale.
+        """
+        while True:
+            pending = [task for task in tasks if not self.is_done(task)]
+            if not pending:
+                return
+
+            claimed = False
+            for task in pending:
+                claim = self.claim(task)
+                if claim:
+                    claimed = True
+                    yield claim
+
+            if not claimed:
+                if not waits:
+                    return
+                time.sleep(POLL_INTERVAL)
+
+
+class Manifest:
+    def __init__(self, path):
+        """Load job manifest.
+
+        Arguments:
+        path (str) -- Path to manifest file.
+        """
+        self.path = path
+        self.workdir = path + WORK_SUFFIX
+        dirpath = os.path.dirname(os.path.abspath(path))
+
+        with open(path) as f:
+            manifest = json.load(f)
+        self.shard_size = manifest.get('shard_size', DEFAULT_SHARD_SIZE)
+
+        def resolve(job, key):
+            if job.get(key) is None:
+                return None
+            return os.path.join(dirpath, job[key])
+
+        self.jobs = []
+        for job in manifest['jobs']:
+            job = dict(job)
+            for key in ('input', 'output', 'location', 'camera'):
+                job[key] = resolve(job, key)
+            self.jobs.append(job)
+
+        plan = self._load_plan()
+        if len(plan) != len(self.jobs):
+            raise ValueError("Work directory {} was made for another"
+                             " manifest.".format(self.workdir))
+        for job, shards in zip(self.jobs, plan):
+            job['shards'] = shards
+
+    def _load_plan(self):
+        """Return shards of each job shared by all nodes.
+
+        The node loading the manifest first splits the jobs and writes the
+        plan into the work directory, so that every node processes the same
+        byte ranges even if they see different sizes of the inputs.
+        """
+        os.makedirs(self.workdir, exist_ok=True)
+        plan_path = os.path.join(self.workdir, PLAN_FILENAME)
+        if not os.path.exists(plan_path):
+            plan = [job.get('shards') or self._split(job['input'])
+                    for job in self.jobs]
+            temp_path = '{}.tmp-{}'.format(plan_path, uuid.uuid4().hex)
+            with open(temp_path, 'w') as f:
+                json.dump(plan, f)
+
+            # link instead of replace to keep the plan of a faster node
+            try:
+                os.link(temp_path, plan_path)
+            except FileExistsError:
+                pass
+            os.remove(temp_path)
+
+        with open(plan_path) as f:
+            return json.load(f)
+
+    def _split(self, path):
+        # compressed stream can't be split by byte offset
+        if compression_of(path):
+            return [[0, None]]
+        size = os.path.getsize(path)
+        return [[start, start + self.shard_size]
+                for start in range(0, max(size, 1), self.shard_size)]
+
+    @staticmethod
+    def task_name(job_index, shard_index):
+        return 'job{:04d}-shard{:06d}'.format(job_index, shard_index)
+
+    def tasks(self):
+        """Return task names with the index, the job and the byte range of
+        each shard.
+        """
+        return [(self.task_name(job_index, shard_index), job_index, job,
+                 shard)
+                for job_index, job in enumerate(self.jobs)
+                for shard_index, shard in enumerate(job['shards'])]
+
+    def part_path(self, task, job, temporary=False):
+        """Return path to output part of task keeping compression extension.
+
+        Arguments:
+        task (str) -- Task name.
+        job (dict) -- Job of the task.
+        temporary (bool) -- Whether to return unique path to write the part
+                            before moving it to the final path.
+        """
+        name = task + '.part'
+        if temporary:
+            name += '.tmp-' + uuid.uuid4().hex
+        if compression_of(job['output']):
+            name += os.path.splitext(job['output'])[1]
+        return os.path.join(self.workdir, name)
+
+    def models_path(self, job_index):
+        """Return path to model store shared by workers processing the job.
+        """
+        return os.path.join(self.workdir, 'job{:04d}.models'.format(job_index))
+
+    def merge(self, queue):
+        """Concatenate output parts of finished jobs in order.
+
+        Compressed parts are concatenated as they are, since both gzip
+        members and zstd frames can be concatenated. The parts are removed
+        after the output was completed.
+
+        Returns:
+        merged ([str]) -- Paths to outputs of jobs merged now.
+        """
+        merged = []
+        for job_index, job in enumerate(self.jobs):
+            marker = os.path.join(self.workdir,
+                                  'job{:04d}.merged'.format(job_index))
+            tasks = [self.task_name(job_index, shard_index)
+                     for shard_index in range(len(job['shards']))]
+            if os.path.exists(marker) or not all(map(queue.is_done, tasks)):
+                continue
+
+            temp_path = '{}.tmp-{}'.format(job['output'], uuid.uuid4().hex)
+            try:
+                with open(temp_path, 'wb') as out:
+                    for task in tasks:
+                        with open(self.part_path(task, job), 'rb') as part:
+                            shutil.copyfileobj(part, out)
+            except FileNotFoundError:
+                os.remove(temp_path)
+                if os.path.exists(marker):
+                    continue  # merged by another node meanwhile
+                raise
+            os.replace(temp_path, job['output'])
+
+            fd = os.open(marker, os.O_CREAT | os.O_WRONLY, 0o644)
+            os.close(fd)
+            merged.append(job['output'])
+
+            for task in tasks:
+                try:
+                    os.remove(self.part_path(task, job))
+                except FileNotFoundError:
+                    pass
+
+        return merged
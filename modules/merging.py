@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+"""
+Merge tracklogs of overlapping cameras in the real-world coordinates.
+
+(C) 2026 1024jp
+"""
+
+import csv
+import heapq
+import math
+from itertools import chain, groupby
+
+
+# constants
+DEFAULT_FRAME_COLUMN = 1
+DEFAULT_INPUT_COLUMNS = (2, 3)
+MIN_CELL_SIZE = 1  # grid cell size for small threshold distance
+NEIGHBOR_CELLS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+
+
+class Detection:
+    __slots__ = ('frame', 'camera', 'x', 'y', 'row')
+
+    def __init__(self, frame, camera, x, y, row):
+        self.frame = frame
+        self.camera = camera
+        self.x = x
+        self.y = y
+        self.row = row
+
+
+def read_detections(file, camera, frame_col=DEFAULT_FRAME_COLUMN,
+                    in_cols=DEFAULT_INPUT_COLUMNS, header=None):
+    """Iterate detections in a tracklog sorted by frame.
+
+    Arguments:
+    file (file) -- Tracklog in file-like object form.
+    camera (int) -- Index of the camera to tag detections.
+    frame_col (int) -- Column index of frame number or time.
+    in_cols (int, int) -- Column indexes of x,y coordinates.
+    header (list) -- List to store the header row in if found.
+    """
+    # detect delimiter
+    first_line = file.readline()
+    dialect = csv.Sniffer().sniff(first_line, delimiters=',\t')
+
+    last_frame = -math.inf
+    for row in csv.reader(chain([first_line], file), dialect):
+        try:
+            frame = float(row[frame_col])
+            x = float(row[in_cols[0]])
+            y = float(row[in_cols[1]])
+        except (ValueError, IndexError):
+            if header is not None and not header and row:
+                header.extend(row)
+            continue
+
+        if frame < last_frame:
+            raise ValueError("Tracklog of camera {} is not sorted by frame"
+                             " at frame {}.".format(camera, frame))
+        last_frame = frame
+
+        yield Detection(frame, camera, x, y, row)
+
+
+def deduplicate(detections, distance):
+    """Drop detections close to one already seen by another camera.
+
+    Detections are bucketed into a grid of the threshold size so that only
+    the neighbor cells need to be compared.
+
+    Arguments:
+    detections ([Detection]) -- Detections in the same frame.
+    distance (float) -- Threshold distance in the real world, or 0 to drop
+                        only detections at exactly the same position.
+    """
+    grid = {}
+    squared_distance = distance * distance
+    cell_size = max(distance, MIN_CELL_SIZE)
+    for detection in detections:
+        cell = (math.floor(detection.x / cell_size),
+                math.floor(detection.y / cell_size))
+
+        is_duplicate = False
+        for dx, dy in NEIGHBOR_CELLS:
+            for other in grid.get((cell[0] + dx, cell[1] + dy), ()):
+                if other.camera == detection.camera:
+                    continue
+                if ((other.x - detection.x) ** 2 +
+                        (other.y - detection.y) ** 2 <= squared_distance):
+                    is_duplicate = True
+                    break
+            if is_duplicate:
+                break
+
+        if not is_duplicate:
+            grid.setdefault(cell, []).append(detection)
+            yield detection
+
+
+def merge(files, output, distance, frame_col=DEFAULT_FRAME_COLUMN,
+          in_cols=DEFAULT_INPUT_COLUMNS):
+    """Merge calibrated tracklogs into one.
+
+    Only a frame of detections is kept in memory at a time. The index of
+    the source camera is appended to each row.
+
+    Arguments:
+    files ([file]) -- Tracklogs sorted by frame in file-like object form.
+    output (file) -- File-like object to write the merged tracklog.
+    distance (float) -- Threshold distance to treat as the same object.
+    frame_col (int) -- Column index of frame number or time.
+    in_cols (int, int) -- Column indexes of x,y coordinates.
+    """
+    header = []
+    streams = [read_detections(file, camera, frame_col, in_cols,
+                               header if camera == 0 else None)
+               for camera, file in enumerate(files)]
+    merged = heapq.merge(*streams, key=lambda detection: detection.frame)
+
+    writer = csv.writer(output, delimiter='\t', lineterminator='\n')
+    header_written = False
+    for _, detections in groupby(merged, key=lambda det: det.frame):
+        # header is found while reading the first frame
+        if not header_written:
+            if header:
+                writer.writerow(header + ['camera'])
+            header_written = True
+
+        for detection in deduplicate(detections, distance):
+            writer.writerow(detection.row + [detection.camera])
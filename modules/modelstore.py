@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+"""
+Read-only store of model arrays shared by worker processes.
+
+Arrays are laid out in a single file that every process maps into memory,
+so that the pages are shared through the OS page cache instead of each
+worker holding its own copy. The file is placed in /dev/shm when available.
+
+(C) 2026 1024jp
+"""
+
+import json
+import mmap
+import os
+import tempfile
+
+import numpy as np
+
+from .projection import Projector
+from .triangulation import PiecewiseAffine
+from .undistortion import Undistorter
+
+
+# constants
+ALIGNMENT = 64
+HEADER_LENGTH_SIZE = 8
+SHARED_DIRECTORY = '/dev/shm'
+UNDISTORTER_KEYS = ('camera_matrix', 'dist_coeffs', 'new_camera_matrix',
+                    'image_size')
+PIECEWISE_KEYS = ('barycentrics', 'affines', 'candidates', 'grid_origin',
+                  'cell_size', 'divisions')
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+class ModelStore:
+    def __init__(self, path):
+        """Attach to model store file read-only.
+
+        Arguments:
+        path (str) -- Path to store file.
+        """
+        self.path = path
+        self.is_temporary = False  # whether to remove the file on exit
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        length = int.from_bytes(self._mmap[:HEADER_LENGTH_SIZE], 'little')
+        manifest = json.loads(
+                self._mmap[HEADER_LENGTH_SIZE:HEADER_LENGTH_SIZE + length])
+        self.arrays = {}
+        for key, (dtype, shape, offset) in manifest.items():
+            count = int(np.prod(shape, dtype=np.int64))
+            self.arrays[key] = np.frombuffer(self._mmap, dtype, count,
+                                             offset).reshape(shape)
+
+    @classmethod
+    def create(cls, arrays, path=None):
+        """Write arrays into a new store file and attach to it.
+
+        Arguments:
+        arrays (dict) -- NumPy arrays by name.
+        path (str) -- Path to store file or None for a temporary file
+                      removed when the store is used as a context manager
+                      and exits.
+        """
+        is_temporary = path is None
+        if is_temporary:
+            directory = (SHARED_DIRECTORY if os.path.isdir(SHARED_DIRECTORY)
+                         else None)
+            fd, path = tempfile.mkstemp(suffix='.models', dir=directory)
+            os.close(fd)
+
+        # manifest of dtype, shape and offset for each array
+        arrays = {key: np.ascontiguousarray(array)
+                  for key, array in arrays.items()}
+        manifest = {}
+        offset = 0
+        for key, array in arrays.items():
+            manifest[key] = [array.dtype.str, list(array.shape), offset]
+            offset = _aligned(offset + array.nbytes)
+        header = json.dumps(manifest).encode('utf-8')
+
+        # shift offsets behind the header leaving room for longer digits
+        base = _aligned(HEADER_LENGTH_SIZE + len(header) +
+                        16 * len(manifest) + ALIGNMENT)
+        for entry in manifest.values():
+            entry[2] += base
+        header = json.dumps(manifest).encode('utf-8')
+        assert HEADER_LENGTH_SIZE + len(header) <= base
+
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(len(header).to_bytes(HEADER_LENGTH_SIZE, 'little'))
+            f.write(header)
+            for key, array in arrays.items():
+                f.seek(manifest[key][2])
+                f.write(array.tobytes())
+        os.replace(temp_path, path)
+
+        store = cls(path)
+        store.is_temporary = is_temporary
+        return store
+
+    def __getstate__(self):
+        # workers attach by path instead of copying arrays
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def close(self):
+        """Detach from store file.
+
+        The mapping is kept until models using the arrays are released.
+        """
+        self.arrays = {}
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass  # arrays are still referred to
+
+    def unlink(self):
+        """Remove store file. Attached processes keep their mappings.
+        """
+        os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        if self.is_temporary:
+            try:
+                self.unlink()
+            except FileNotFoundError:
+                pass  # already removed
+
+
+def publish_models(undistorter, projector=None, includes_maps=True,
+                   path=None):
+    """Store arrays of models to be shared with worker processes.
+
+    Arguments:
+    undistorter (Undistorter) -- Camera model.
+    projector (Projector) -- Projector or None.
+    includes_maps (bool) -- Whether to also store undistortion maps.
+    path (str) -- Path to store file or None for a temporary file removed
+                  on exit of the returned store as a context manager.
+    """
+    arrays = {key: np.asarray(getattr(undistorter, key))
+              for key in UNDISTORTER_KEYS}
+    if includes_maps:
+        arrays['map_x'], arrays['map_y'] = undistorter.undistort_maps()
+
+    if projector:
+        for index, (height, homography) in enumerate(
+                projector.homographies.items()):
+            prefix = 'projector/{}/'.format(index)
+            arrays[prefix + 'height'] = np.float64(height)
+            arrays[prefix + 'homography'] = homography
+            piecewise = projector.piecewise.get(height)
+            if piecewise:
+                inverse = projector.inverse_piecewise[height]
+                for key in PIECEWISE_KEYS:
+                    arrays[prefix + 'piecewise/' + key] = np.asarray(
+                            getattr(piecewise, key))
+                    arrays[prefix + 'inverse/' + key] = np.asarray(
+                            getattr(inverse, key))
+
+    return ModelStore.create(arrays, path)
+
+
+def attach_models(store):
+    """Create models whose arrays are views of the store.
+
+    Arguments:
+    store (ModelStore or str) -- Model store or path to store file.
+
+    Returns:
+    undistorter (Undistorter) -- Camera model without rvecs and tvecs.
+    projector (Projector) -- Projector or None if not stored.
+    """
+    if isinstance(store, str):
+        store = ModelStore(store)
+    arrays = store.arrays
+
+    undistorter = Undistorter(arrays['camera_matrix'], arrays['dist_coeffs'],
+                              None, None, tuple(arrays['image_size'].tolist()),
+                              arrays['new_camera_matrix'])
+    if 'map_x' in arrays:
+        undistorter._maps = (arrays['map_x'], arrays['map_y'])
+
+    homographies = {}
+    piecewise = {}
+    inverse_piecewise = {}
+    index = 0
+    while 'projector/{}/height'.format(index) in arrays:
+        prefix = 'projector/{}/'.format(index)
+        height = arrays[prefix + 'height'].item()
+        homographies[height] = arrays[prefix + 'homography']
+        if prefix + 'piecewise/affines' in arrays:
+            piecewise[height] = _attach_piecewise(
+                    arrays, prefix + 'piecewise/')
+            inverse_piecewise[height] = _attach_piecewise(
+                    arrays, prefix + 'inverse/')
+        index += 1
+
+    projector = None
+    if homographies:
+        projector = Projector.from_arrays(homographies, piecewise,
+                                          inverse_piecewise)
+
+    return undistorter, projector
+
+
+def _attach_piecewise(arrays, prefix):
+    parameters = {key: arrays[prefix + key] for key in PIECEWISE_KEYS}
+    parameters['divisions'] = parameters['divisions'].item()
+    return PiecewiseAffine.from_arrays(**parameters)
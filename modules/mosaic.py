@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+"""
+Stitch images of multiple calibrated cameras into a ground-plane mosaic.
+
+(C) 2026 1024jp
+"""
+
+import cv2
+import numpy as np
+
+
+# constants
+FEATHER = 64  # width of blending border in pixel
+CHUNK_ROWS = 256  # number of output rows mapped at once
+
+
+class Mosaic:
+    def __init__(self, cameras, width=None, scale=None, z=None,
+                 feather=FEATHER):
+        """Precompute remap tables and blending weights of cameras.
+
+        Arguments:
+        cameras ([(Undistorter, Projector)]) -- Camera models and projectors
+                                                fitted to undistorted points.
+        width (int) -- Width of the mosaic in pixel, or None for the width
+                       of the first camera image.
+        scale (float) -- Output pixels per real-world unit. Overrides width.
+        z (float) -- Height of the plane to project on.
+        feather (int) -- Width of blending border in pixel.
+        """
+        self.cameras = cameras
+        self.z = z
+
+        # union of the fields of view in the real world
+        corners = np.vstack([self._world_corners(undistorter, projector)
+                             for undistorter, projector in cameras])
+        origin = corners.min(axis=0)
+        extent = corners.max(axis=0) - origin
+        if scale is None:
+            width = width or cameras[0][0].image_size[0]
+            scale = float(width) / extent[0]
+        self.origin = tuple(origin)
+        self.scale = scale
+        self.size = tuple(int(np.ceil(length * scale)) for length in extent)
+
+        self.maps = []
+        masks = []
+        for undistorter, projector in cameras:
+            map1, map2, mask = self._build_map(undistorter, projector)
+            self.maps.append((map1, map2))
+            masks.append(mask)
+        self.weights = self._build_weights(masks, feather)
+
+        # work buffers reused for every frame
+        self._warped = None
+        self._product = None
+        self._accumulator = None
+
+    @property
+    def rect(self):
+        """Covered area in the real world as NSRect style 2d-tuple.
+        """
+        extent = tuple(length / self.scale for length in self.size)
+        return self.origin, extent
+
+    def _world_corners(self, undistorter, projector):
+        width, height = undistorter.image_size
+        corners = [(0, 0), (width, 0), (0, height), (width, height)]
+        return np.array([projector.project_point(x, y, self.z)
+                         for x, y in corners])
+
+    def _build_map(self, undistorter, projector):
+        """Return fused undistortion and projection map for a camera.
+        """
+        width, height = self.size
+        image_width, image_height = undistorter.image_size
+        inverse = np.linalg.inv(projector.homography_at(self.z))
+
+        map_x = np.empty((height, width), np.float32)
+        map_y = np.empty((height, width), np.float32)
+        valid = np.empty((height, width), np.uint8)
+        xs = self.origin[0] + np.arange(width) / self.scale
+        for top in range(0, height, CHUNK_ROWS):
+            bottom = min(top + CHUNK_ROWS, height)
+            ys = self.origin[1] + np.arange(top, bottom) / self.scale
+            world_x, world_y = np.meshgrid(xs, ys)
+
+            # real world -> undistorted image
+            points = np.stack([world_x.ravel(), world_y.ravel(),
+                               np.ones(world_x.size)])
+            points = inverse @ points
+            undistorted = (points[:2] / points[2]).T
+            inside = ((points[2] > 0) &
+                      (undistorted[:, 0] >= 0) &
+                      (undistorted[:, 0] < image_width) &
+                      (undistorted[:, 1] >= 0) &
+                      (undistorted[:, 1] < image_height))
+            undistorted[~inside] = 0
+
+            # undistorted -> distorted image
+            distorted = undistorter.distort_points(undistorted)
+            inside &= ((distorted[:, 0] >= 0) &
+                       (distorted[:, 0] <= image_width - 1) &
+                       (distorted[:, 1] >= 0) &
+                       (distorted[:, 1] <= image_height - 1))
+            distorted[~inside] = -1
+
+            shape = (bottom - top, width)
+            map_x[top:bottom] = distorted[:, 0].reshape(shape)
+            map_y[top:bottom] = distorted[:, 1].reshape(shape)
+            valid[top:bottom] = inside.reshape(shape)
+
+        # fixed-point maps are remapped faster
+        map1, map2 = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+        return map1, map2, valid
+
+    @staticmethod
+    def _build_weights(masks, feather):
+        """Return normalized blending weights fading out at mask borders.
+        """
+        weights = []
+        for mask in masks:
+            distance = cv2.distanceTransform(mask, cv2.DIST_L2, 5)
+            weights.append(np.minimum(distance, feather))
+        total = np.sum(weights, axis=0)
+        np.maximum(total, np.finfo(np.float32).tiny, out=total)
+        return [(weight / total)[..., np.newaxis] for weight in weights]
+
+    def stitch(self, images, out=None):
+        """Blend images of the cameras into the mosaic.
+
+        Arguments:
+        images ([numpy.array]) -- Images in the order of cameras.
+        out (numpy.array) -- Destination buffer or None to allocate.
+
+        Returns:
+        mosaic (numpy.array) -- Mosaic image.
+        """
+        width, height = self.size
+        shape = (height, width) + images[0].shape[2:]
+        if self._accumulator is None or self._accumulator.shape != shape:
+            self._warped = np.empty(shape, images[0].dtype)
+            self._product = np.empty(shape, np.float32)
+            self._accumulator = np.empty(shape, np.float32)
+        if out is None:
+            out = np.empty(shape, images[0].dtype)
+
+        weight_shape = (height, width) + (1,) * (len(shape) - 2)
+        accumulator = self._accumulator
+        accumulator.fill(0)
+        for image, (map1, map2), weight in zip(images, self.maps,
+                                               self.weights):
+            cv2.remap(image, map1, map2, cv2.INTER_LINEAR, dst=self._warped,
+                      borderMode=cv2.BORDER_CONSTANT)
+            np.multiply(self._warped, weight.reshape(weight_shape),
+                        out=self._product)
+            accumulator += self._product
+
+        np.rint(accumulator, out=accumulator)
+        np.copyto(out, accumulator, casting='unsafe')
+        return out
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Undistort only patches of frames around tracked points.
+
+(C) 2026 1024jp
+"""
+
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+# constants
+BUCKET_SIZE = 32  # in pixel
+CACHE_SIZE = 1024  # number of remap grids to keep
+
+
+class PatchUndistorter:
+    def __init__(self, undistorter, bucket_size=BUCKET_SIZE,
+                 cache_size=CACHE_SIZE):
+        """Initialize patch extractor for a camera model.
+
+        Remap grids are cached by patch size and position bucket. A grid
+        covers the patch plus a bucket in each direction, so that every patch
+        whose origin falls in the bucket is a slice of the same grid.
+
+        Arguments:
+        undistorter (Undistorter) -- Camera model.
+        bucket_size (int) -- Size of position buckets in pixel.
+        cache_size (int) -- Maximum number of remap grids to keep.
+        """
+        self.undistorter = undistorter
+        self.bucket_size = bucket_size
+        self.cache_size = cache_size
+        self._grids = OrderedDict()
+
+    def _grid(self, width, height, bucket):
+        key = (width, height) + bucket
+        grid = self._grids.get(key)
+        if grid is not None:
+            self._grids.move_to_end(key)
+            return grid
+
+        # distorted source of each pixel in undistorted space
+        size = self.bucket_size
+        ys, xs = np.mgrid[0:height + size, 0:width + size]
+        points = np.stack([xs.ravel() + bucket[0] * size,
+                           ys.ravel() + bucket[1] * size], axis=1)
+        sources = self.undistorter.distort_points(points).astype(np.float32)
+        grid = (sources[:, 0].reshape(xs.shape),
+                sources[:, 1].reshape(xs.shape))
+
+        self._grids[key] = grid
+        if len(self._grids) > self.cache_size:
+            self._grids.popitem(last=False)
+        return grid
+
+    def undistort_patches(self, frame, rois):
+        """Return undistorted patches around points in frame.
+
+        Arguments:
+        frame (numpy.array) -- Distorted image.
+        rois ([(float, float, int, int)]) -- Center x, y in distorted image,
+                                             such as coordinates in tracklog,
+                                             and width, height of patches.
+
+        Returns:
+        patches ([numpy.array]) -- Undistorted patches in the order of rois.
+        """
+        if not len(rois):
+            return []
+        rois = np.asarray(rois, np.float64).reshape(-1, 4)
+        centers = self.undistorter.calibrate_points(rois[:, :2])
+        centers = np.reshape(centers, (-1, 2))
+        sizes = rois[:, 2:].astype(int)
+        origins = np.rint(centers - sizes / 2).astype(int)
+        buckets = origins // self.bucket_size
+
+        patches = []
+        for (width, height), origin, bucket in zip(sizes.tolist(),
+                                                   origins.tolist(),
+                                                   buckets.tolist()):
+            map_x, map_y = self._grid(width, height, tuple(bucket))
+            left = origin[0] - bucket[0] * self.bucket_size
+            top = origin[1] - bucket[1] * self.bucket_size
+            area = (slice(top, top + height), slice(left, left + width))
+            patches.append(cv2.remap(frame, map_x[area], map_y[area],
+                                     cv2.INTER_LINEAR,
+                                     borderMode=cv2.BORDER_CONSTANT))
+
+        return patches
@@ -5,27 +5,70 @@
 (C) 2007-2018 1024jp
 """
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from itertools import groupby
 
 import numpy as np
 import cv2
 
+from .triangulation import delaunay, PiecewiseAffine
+
+
+# constants
+TILE_HEIGHT = 256  # number of rows warped in a thread at once
+
 
 class Projector:
-    def __init__(self, image_points, dest_points):
-        # group by height
-        points = {}
-        for image_point, dest_point in zip(image_points, dest_points):
-            height = dest_point[2]
-            if height not in points:
-                points[height] = [[], []]
-            points[height][0].append(image_point)
-            points[height][1].append(dest_point[:2])
-
-        # get homography for each height
+    def __init__(self, image_points, dest_points, piecewise=False):
+        """Fit projection from image to the real world for each height.
+
+        Arguments:
+        image_points -- x,y pairs of undistorted reference points in image.
+        dest_points -- corresponding x,y,z pairs of ref points in field.
+        piecewise (bool) -- Whether to also fit an affine transform on each
+                            triangle of the reference points. Points outside
+                            the triangulation fall back to the homography.
+        """
+        image_points = np.asarray(image_points, np.float64)
+        dest_points = np.asarray(dest_points, np.float64)
+
+        # get homography for each height in order of appearance
         self.homographies = {}
-        for height, points in points.items():
-            self.homographies[height] = self._estimate_homography(*points)
+        self._inverse_homographies = {}
+        self.piecewise = {}
+        self.inverse_piecewise = {}
+        heights = dest_points[:, 2]
+        for height in dict.fromkeys(heights.tolist()):
+            mask = heights == height
+            self.homographies[height] = self._estimate_homography(
+                    image_points[mask], dest_points[mask, :2])
+
+            if piecewise and mask.sum() >= 3:
+                src = image_points[mask]
+                dest = dest_points[mask, :2]
+                triangles = delaunay(src)
+                self.piecewise[height] = PiecewiseAffine(src, dest,
+                                                         triangles)
+                self.inverse_piecewise[height] = PiecewiseAffine(dest, src,
+                                                                 triangles)
+
+    @classmethod
+    def from_arrays(cls, homographies, piecewise=None,
+                    inverse_piecewise=None):
+        """Create projector from transforms fitted beforehand.
+
+        Arguments:
+        homographies (dict) -- Homography matrix for each height.
+        piecewise (dict) -- PiecewiseAffine for each height or None.
+        inverse_piecewise (dict) -- Inverse PiecewiseAffine for each height
+                                    or None.
+        """
+        projector = cls.__new__(cls)
+        projector.homographies = dict(homographies)
+        projector._inverse_homographies = {}
+        projector.piecewise = dict(piecewise or {})
+        projector.inverse_piecewise = dict(inverse_piecewise or {})
+        return projector
 
     @staticmethod
     def _estimate_homography(image_points, dest_points):
@@ -36,6 +79,16 @@ class Projector:
         H, _ = cv2.findHomography(fp, tp, 0)
         return H
 
+    def homography_at(self, z=None):
+        """Return homography matrix for given height.
+
+        Arguments:
+        z (float) -- Height or None for the first height in location file.
+        """
+        if z:
+            return self.homographies[z]
+        return next(iter(self.homographies.values()))
+
     def project_point(self, x, y, z=None):
         """Project x, y coordinates using homography matrix.
 
@@ -44,28 +97,142 @@ class Projector:
         y (float) -- y coordinate to project.
         z (float) -- z coordinate to project.
         """
-        if z:
-            homography = self.homographies[z]
-        else:
-            homography = list(self.homographies.values())[0]
+        if self.piecewise:
+            return tuple(self.project_points([(x, y)], [z or np.nan])[0])
+
+        homography = self.homography_at(z)
         result = np.dot(homography, [x, y, 1])
         projected_x = result[0] / result[2]
         projected_y = result[1] / result[2]
 
         return projected_x, projected_y
 
-    def project_image(self, image, size, offset=(0, 0)):
+    def project_points(self, points, zs=None):
+        """Project x, y coordinates of multiple points at once.
+
+        Arguments:
+        points -- Nx2 array of x, y coordinates to project.
+        zs -- N array of z coordinates (NaN for none) or None.
+
+        Returns:
+        dest (numpy.array) -- Nx2 array of projected coordinates.
+        """
+        return self._transform_points(points, zs, self.homography_at,
+                                      self.piecewise)
+
+    def unproject_points(self, points, zs=None):
+        """Translate real-world x, y coordinates back to the image.
+
+        This is the inverse of project_points().
+
+        Arguments:
+        points -- Nx2 array of real-world x, y coordinates.
+        zs -- N array of z coordinates (NaN for none) or None.
+
+        Returns:
+        dest (numpy.array) -- Nx2 array of coordinates in the image.
+        """
+        return self._transform_points(points, zs, self.inverse_homography_at,
+                                      self.inverse_piecewise)
+
+    def inverse_homography_at(self, z=None):
+        """Return inverse homography matrix for given height.
+
+        Arguments:
+        z (float) -- Height or None for the first height in location file.
+        """
+        key = z or None
+        if key not in self._inverse_homographies:
+            inverse = np.linalg.inv(self.homography_at(z))
+            self._inverse_homographies[key] = inverse
+        return self._inverse_homographies[key]
+
+    def _transform_points(self, points, zs, matrix_at, piecewise):
+        points = np.asarray(points, np.float64).reshape(-1, 2)
+        dest = np.empty_like(points)
+
+        if zs is None:
+            zs = np.full(len(points), np.nan)
+        zs = np.asarray(zs, np.float64)
+        no_height = np.isnan(zs) | (zs == 0)
+
+        groups = [(no_height, None)]
+        for z in np.unique(zs[~no_height]):
+            groups.append((zs == z, z))
+
+        for mask, z in groups:
+            if not mask.any():
+                continue
+            matrix = matrix_at(z)
+            result = points[mask] @ matrix[:, :2].T + matrix[:, 2]
+            result = result[:, :2] / result[:, 2:]
+
+            # local transform where the points are in the triangulation
+            height = z or next(iter(self.homographies))
+            if height in piecewise:
+                local = piecewise[height].transform(points[mask])
+                found = ~np.isnan(local[:, 0])
+                result[found] = local[found]
+
+            dest[mask] = result
+
+        return dest
+
+    def project_image(self, image, size, offset=(0, 0), z=None, scale=1.0,
+                      out=None, max_bytes=None, tile_height=TILE_HEIGHT,
+                      max_workers=None):
         """Remove parspective from given image.
 
+        The output is split into horizontal tiles that are warped in
+        parallel threads directly into the destination buffer.
+
         Arguments:
         image numpy.array -- Image source in numpy image form.
-        size ([int]) -- Size of the output image.
+        size ([int]) -- Size of the output image in pixel.
+        offset ([float]) -- Real-world coordinates of the output origin.
+        z (float) -- Height of the plane to project on.
+        scale (float) -- Output pixels per real-world unit.
+        out (numpy.array) -- Preallocated destination buffer to reuse.
+        max_bytes (int) -- Upper limit in bytes of the output buffer to
+                           allocate when out is not reusable.
+        tile_height (int) -- Number of rows warped at once.
+        max_workers (int) -- Number of threads or None for the default.
         """
-        translation = np.matrix([
-            [1.0, 0.0, -offset[0]],
-            [0.0, 1.0, -offset[1]],
+        width, height = map(int, size)
+        shape = (height, width) + image.shape[2:]
+
+        if (out is None or out.shape != shape or out.dtype != image.dtype or
+                not out.flags.c_contiguous):
+            nbytes = width * height * image.itemsize
+            for length in image.shape[2:]:
+                nbytes *= length
+            if max_bytes is not None and nbytes > max_bytes:
+                raise MemoryError(
+                        "Projected image of {}x{} requires {} bytes,"
+                        " exceeding the limit of {} bytes.".format(
+                                width, height, nbytes, max_bytes))
+            out = np.empty(shape, image.dtype)
+
+        transform = np.array([
+            [scale, 0.0, -scale * offset[0]],
+            [0.0, scale, -scale * offset[1]],
             [0.0, 0.0, 1.0]
-        ])
-        matrix = translation * self.homography
+        ]) @ self.homography_at(z)
+
+        def warp(top):
+            bottom = min(top + tile_height, height)
+            translation = np.array([
+                [1.0, 0.0, 0.0],
+                [0.0, 1.0, -top],
+                [0.0, 0.0, 1.0]
+            ])
+            # rows of a C-contiguous buffer are contiguous, so OpenCV
+            # writes into the tile in place
+            cv2.warpPerspective(image, translation @ transform,
+                                (width, bottom - top), dst=out[top:bottom],
+                                borderMode=cv2.BORDER_CONSTANT)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(warp, range(0, height, tile_height)))
 
-        return cv2.warpPerspective(image, matrix, tuple(size))
+        return out
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+"""
+Piecewise affine mapping on Delaunay triangulation of reference points.
+
+(C) 2026 1024jp
+"""
+
+import math
+
+import cv2
+import numpy as np
+
+
+# constants
+EPSILON = 1e-9  # tolerance of barycentric coordinates on triangle edges
+CHUNK_SIZE = 65536  # number of points located at once
+GRID_DENSITY = 4  # number of grid divisions per square root of triangles
+
+
+def delaunay(points):
+    """Triangulate points.
+
+    Arguments:
+    points (numpy.array) -- Nx2 array of points.
+
+    Returns:
+    triangles (numpy.array) -- Mx3 array of point indexes.
+    """
+    points = np.asarray(points, np.float32)
+    lower = points.min(axis=0) - 1
+    upper = points.max(axis=0) + 1
+    rect = (int(math.floor(lower[0])), int(math.floor(lower[1])),
+            int(math.ceil(upper[0] - lower[0])) + 1,
+            int(math.ceil(upper[1] - lower[1])) + 1)
+
+    subdiv = cv2.Subdiv2D(rect)
+    indexes = {}
+    for index, point in enumerate(points):
+        indexes.setdefault(tuple(point.tolist()), index)
+        subdiv.insert(tuple(point.tolist()))
+
+    triangles = []
+    for vertices in subdiv.getTriangleList().reshape(-1, 3, 2):
+        # skip triangles with the virtual vertices of Subdiv2D
+        keys = [tuple(vertex.tolist()) for vertex in vertices]
+        if all(key in indexes for key in keys):
+            triangles.append([indexes[key] for key in keys])
+
+    return np.array(triangles, np.intp).reshape(-1, 3)
+
+
+class PiecewiseAffine:
+    def __init__(self, src_points, dest_points, triangles):
+        """Fit an affine transform on each triangle and index triangles.
+
+        Arguments:
+        src_points (numpy.array) -- Nx2 array of source points.
+        dest_points (numpy.array) -- Nx2 array of corresponding points.
+        triangles (numpy.array) -- Mx3 array of point indexes.
+        """
+        src_points = np.asarray(src_points, np.float64)
+        dest_points = np.asarray(dest_points, np.float64)
+        vertices = src_points[triangles]  # Mx3x2
+
+        # basis to get barycentric coordinates in each triangle
+        origins = vertices[:, 0]
+        bases = np.stack([vertices[:, 1] - origins,
+                          vertices[:, 2] - origins], axis=2)
+        valid = np.abs(np.linalg.det(bases)) > EPSILON
+        triangles = triangles[valid]
+        vertices = vertices[valid]
+        self.barycentrics = np.concatenate([
+            np.linalg.inv(bases[valid]).reshape(-1, 4), origins[valid]
+        ], axis=1)  # Mx6 of inverse basis and origin
+
+        # affine matrix of each triangle
+        homogeneous = np.concatenate([vertices, np.ones(vertices.shape[:2] +
+                                                        (1,))], axis=2)
+        self.affines = np.linalg.solve(homogeneous, dest_points[triangles])
+        self.affines = self.affines.transpose(0, 2, 1)  # Mx2x3
+
+        self._build_grid(vertices)
+
+    @classmethod
+    def from_arrays(cls, barycentrics, affines, candidates, grid_origin,
+                    cell_size, divisions):
+        """Create mapping from the arrays of a fitted mapping.
+
+        Arguments are the attributes of the same names.
+        """
+        piecewise = cls.__new__(cls)
+        piecewise.barycentrics = barycentrics
+        piecewise.affines = affines
+        piecewise.candidates = candidates
+        piecewise.grid_origin = grid_origin
+        piecewise.cell_size = cell_size
+        piecewise.divisions = int(divisions)
+        return piecewise
+
+    def _build_grid(self, vertices):
+        """Bucket triangles into grid cells overlapping their bounds.
+        """
+        count = max(len(vertices), 1)
+        lower = vertices.min(axis=(0, 1)) if len(vertices) else np.zeros(2)
+        upper = vertices.max(axis=(0, 1)) if len(vertices) else np.ones(2)
+        divisions = max(1, int(GRID_DENSITY * math.sqrt(count)))
+
+        self.grid_origin = lower
+        self.cell_size = np.maximum((upper - lower) / divisions, EPSILON)
+        self.divisions = divisions
+
+        cells = [[] for _ in range(divisions * divisions)]
+        first = self._cells(vertices.min(axis=1))
+        last = self._cells(vertices.max(axis=1))
+        for triangle, (x0, y0), (x1, y1) in zip(range(len(vertices)),
+                                                first, last):
+            for y in range(y0, y1 + 1):
+                for x in range(x0, x1 + 1):
+                    cells[y * divisions + x].append(triangle)
+
+        # pad candidates to make lookup vectorized
+        width = max([len(cell) for cell in cells] + [1])
+        self.candidates = np.full((width, len(cells)), -1, np.intp)
+        for index, cell in enumerate(cells):
+            self.candidates[:len(cell), index] = cell
+
+    def _cells(self, points):
+        cells = np.floor((points - self.grid_origin) / self.cell_size)
+        # non-finite points get a cell but are inside no triangle
+        cells = np.nan_to_num(cells)
+        return np.clip(cells, 0, self.divisions - 1).astype(np.intp)
+
+    def locate(self, points):
+        """Return index of triangle containing each point.
+
+        Arguments:
+        points (numpy.array) -- Nx2 array of points.
+
+        Returns:
+        indexes (numpy.array) -- N array of triangle indexes or -1 if outside.
+        """
+        cells = self._cells(points)
+        cells = cells[:, 1] * self.divisions + cells[:, 0]
+
+        indexes = np.full(len(points), -1, np.intp)
+        pending = np.arange(len(points))
+        for candidates in self.candidates:
+            triangles = candidates[cells[pending]]
+            has_candidate = triangles >= 0
+            pending = pending[has_candidate]
+            triangles = triangles[has_candidate]
+            if not len(pending):
+                break
+
+            # barycentric coordinates of points in the candidates
+            coefficients = self.barycentrics[triangles]
+            x = points[pending, 0] - coefficients[:, 4]
+            y = points[pending, 1] - coefficients[:, 5]
+            u = coefficients[:, 0] * x + coefficients[:, 1] * y
+            v = coefficients[:, 2] * x + coefficients[:, 3] * y
+            inside = ((u >= -EPSILON) & (v >= -EPSILON) &
+                      (u + v <= 1 + EPSILON))
+
+            indexes[pending[inside]] = triangles[inside]
+            pending = pending[~inside]
+
+        return indexes
+
+    def transform(self, points):
+        """Transform points by the affine of the triangle they are in.
+
+        Arguments:
+        points (numpy.array) -- Nx2 array of points.
+
+        Returns:
+        dest (numpy.array) -- Nx2 array of transformed points, NaN where
+                              the point is outside of the triangulation.
+        """
+        points = np.asarray(points, np.float64).reshape(-1, 2)
+        dest = np.full_like(points, np.nan)
+        for start in range(0, len(points), CHUNK_SIZE):
+            chunk = points[start:start + CHUNK_SIZE]
+            indexes = self.locate(chunk)
+            found = indexes >= 0
+            affines = self.affines[indexes[found]]
+            dest[start:start + CHUNK_SIZE][found] = (
+                    np.einsum('nij,nj->ni', affines[:, :, :2], chunk[found]) +
+                    affines[:, :, 2])
+        return dest
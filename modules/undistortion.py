@@ -9,7 +9,6 @@ import pickle
 
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
 
 
 _flags = (cv2.CALIB_ZERO_TANGENT_DIST |
@@ -25,16 +24,19 @@ class Undistorter:
         self.rvecs = rvecs
         self.tvecs = tvecs
         self.image_size = image_size
-        if new_camera_matrix:
+        if new_camera_matrix is not None:
             self.new_camera_matrix = new_camera_matrix
         else:
             self.__get_new_camera_matrix()
+        self._maps = None
 
     @classmethod
     def init(cls, image_points, dest_points, image_size):
-        dest_points = [(x, y, 0) for x, y, z in dest_points]
+        # reference points on a plane
+        object_points = np.zeros((len(dest_points), 3), np.float32)
+        object_points[:, :2] = np.asarray(dest_points)[:, :2]
         _, camera_matrix, dist_coeffs, rvecs, tvecs = cv2.calibrateCamera(
-                [np.float32([dest_points])],
+                [object_points[np.newaxis]],
                 [np.float32([image_points])],
                 image_size, None, None, flags=_flags)
 
@@ -47,28 +49,93 @@ class Undistorter:
     def save(self, f):
         pickle.dump(self, f)
 
+    def __getstate__(self):
+        # drop cached tables that can be rebuilt from the model
+        state = self.__dict__.copy()
+        state['_maps'] = None
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault('_maps', None)
+        self.__dict__.update(state)
+
     def calibrate_points(self, points):
         dest = cv2.undistortPoints(np.array([points]), self.camera_matrix,
                                    self.dist_coeffs,
                                    P=self.new_camera_matrix)
         return np.squeeze(dest)
 
+    def distort_points(self, points):
+        """Return distorted image coordinates of undistorted points.
+
+        This is the inverse of calibrate_points().
+
+        Arguments:
+        points -- x,y pairs of points in undistorted image.
+
+        Returns:
+        dest (numpy.array) -- Nx2 array of points in distorted image.
+        """
+        points = np.asarray(points, np.float64).reshape(-1, 2)
+        inverse = np.linalg.inv(self.new_camera_matrix)
+
+        # back to the normalized camera coordinates on z = 1
+        object_points = np.ones((len(points), 3))
+        object_points[:, :2] = points @ inverse[:2, :2].T + inverse[:2, 2]
+
+        zero = np.zeros(3)
+        dest, _ = cv2.projectPoints(object_points, zero, zero,
+                                    self.camera_matrix, self.dist_coeffs)
+        return dest.reshape(-1, 2)
+
     def undistort_image(self, image):
         return cv2.undistort(image, self.camera_matrix, self.dist_coeffs,
                              newCameraMatrix=self.new_camera_matrix)
 
-    def show_map(self):
-        interval = 200
-        size = self.image_size
-        w, h = np.meshgrid(range(0, size[0], interval),
-                           range(0, size[1], interval))
-        points = np.vstack((w.flatten(), h.flatten())).T.astype('float32')
-        new_points = self.calibrate_points(points)
-
-        plt.scatter(points[:, 0], points[:, 1], 20, 'b', alpha=.5)
-        plt.scatter(new_points[:, 0], new_points[:, 1], 20, 'r', alpha=.5)
-
-        plt.axes().set_aspect('equal', 'datalim')
+    def undistort_maps(self):
+        """Return remap tables from undistorted to distorted image.
+
+        The tables are computed once and cached in the instance.
+
+        Returns:
+        map_x (numpy.array) -- x coordinates in source image for each pixel.
+        map_y (numpy.array) -- y coordinates in source image for each pixel.
+        """
+        if self._maps is None:
+            self._maps = cv2.initUndistortRectifyMap(
+                    self.camera_matrix, self.dist_coeffs, None,
+                    self.new_camera_matrix, tuple(self.image_size),
+                    cv2.CV_32FC1)
+        return self._maps
+
+    def displacement_field(self, interval=1):
+        """Return how far each pixel moves by undistortion.
+
+        Arguments:
+        interval (int) -- Sampling interval in pixel.
+
+        Returns:
+        field (numpy.array) -- HxWx2 array of x, y displacement vectors
+                               sampled on the undistorted image.
+        """
+        map_x, map_y = self.undistort_maps()
+        map_x = map_x[::interval, ::interval]
+        map_y = map_y[::interval, ::interval]
+        grid_y, grid_x = np.mgrid[0:map_x.shape[0], 0:map_x.shape[1]]
+
+        field = np.empty(map_x.shape + (2,), np.float32)
+        np.subtract(grid_x * interval, map_x, out=field[..., 0])
+        np.subtract(grid_y * interval, map_y, out=field[..., 1])
+        return field
+
+    def show_map(self, interval=1):
+        import matplotlib.pyplot as plt
+        from .distortionmap import render_map
+
+        image = render_map(self, interval=interval)
+
+        plt.imshow(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        plt.axis('off')
         plt.show()
 
     def __get_new_camera_matrix(self):
@@ -2,36 +2,121 @@
 """
 Display how the undistorter converts coordinates visibly.
 
-(C) 2016-2018 1024jp
+(C) 2016-2026 1024jp
 """
 
+import contextlib
+import io
 import os
 import sys
+import tempfile
+import unittest
 
 from modules import argsparser
 from modules.datafile import Data
 from modules.undistortion import Undistorter
+from modules import distortionmap
+
+# constants
+SUFFIX = "_map"
+EXTENSION = ".png"
 
 
 class ArgsParser(argsparser.Parser):
     description = 'Display how the undistorter converts coordinates visibly.'
     datafile_name = 'location'
+    datafile_required = False
+
+    def init_arguments(self):
+        super(ArgsParser, self).init_arguments()
+
+        script = self.add_argument_group('script options')
+        script.add_argument('--save',
+                            action='store_true',
+                            default=False,
+                            help="save map in a PNG file instead displaying it"
+                                 " (default: %(default)s)"
+                            )
+        script.add_argument('--interval',
+                            type=int,
+                            default=1,
+                            metavar='PIXEL',
+                            help="sampling interval of the map"
+                                 " (default: %(default)s)"
+                            )
+        script.add_argument('--models',
+                            type=str,
+                            nargs='+',
+                            default=None,
+                            metavar='FILE',
+                            help="camera model files to render into PNG files"
+                                 " in parallel"
+                            )
+        script.add_argument('--jobs',
+                            type=int,
+                            default=None,
+                            metavar='NUMBER',
+                            help="number of threads for --models"
+                                 " (default: number of processors)"
+                            )
+
+    def parse_args(self, **kwargs):
+        args = super(ArgsParser, self).parse_args(**kwargs)
+
+        if not (args.test or args.file or args.models):
+            self.error('This script requires a path to a {} file'
+                       ' or camera model files.\n'.format(self.datafile_name))
+        if args.interval < 1:
+            self.error('--interval must be 1 or more.')
+
+        return args
+
 
+def map_path(path):
+    """Return path for the map image of given file.
 
-def main(data, camera_path=None, size):
+    Arguments:
+    path (str) -- Path to location file or camera model file.
+    """
+    return os.path.splitext(path)[0] + SUFFIX + EXTENSION
+
+
+def main(data, size, camerafile=None, outpath=None, interval=1):
     """Display potential map for given location file.
 
     Arguments:
     data (Data) -- Data source instance.
-    camera_path (str) -- Path to a camera model or None.
     size (int, int) -- Width and height of source image.
+    camerafile (file) -- Camera model file or None.
+    outpath (str) -- Path to save the map, or None to display it.
+    interval (int) -- Sampling interval of the map in pixel.
     """
     if camerafile:
-        undistorter = Undistorter.load(camera_path)
+        undistorter = Undistorter.load(camerafile)
     else:
         undistorter = Undistorter.init(data.image_points, data.dest_points,
                                        size)
-    undistorter.show_map()
+
+    if outpath:
+        distortionmap.save_map(undistorter, outpath, interval=interval)
+    else:
+        undistorter.show_map(interval)
+
+
+def render_models(paths, interval=1, max_workers=None):
+    """Render maps of camera models into PNG files next to each model.
+
+    Arguments:
+    paths ([str]) -- Paths to camera model files.
+    interval (int) -- Sampling interval of the map in pixel.
+    max_workers (int) -- Number of threads or None for the default.
+    """
+    jobs = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            jobs.append((Undistorter.load(f), map_path(path)))
+
+    return distortionmap.save_maps(jobs, max_workers, interval=interval)
 
 
 def test():
@@ -39,10 +124,42 @@ def test():
     """
     from modules.datafile import LOC_FILENAME
     path = os.path.join(os.path.dirname(__file__), 'test', LOC_FILENAME)
-    location_file = open(path, 'r')
 
-    data = Data(open(path, 'r'))
-    main(data, (3840, 2160))
+    with open(path, 'r') as f:
+        data = Data(f)
+    main(data, (3840, 2160), interval=4)
+
+
+class TestCase(unittest.TestCase):
+    dirname = 'test'
+
+    def setUp(self):
+        from modules.datafile import LOC_FILENAME
+        test_dir = os.path.join(os.path.dirname(__file__), self.dirname)
+        with open(os.path.join(test_dir, LOC_FILENAME), 'r') as f:
+            data = Data(f)
+        self.undistorter = Undistorter.init(data.image_points,
+                                            data.dest_points, (3840, 2160))
+
+    def test_render_map(self):
+        image = distortionmap.render_map(self.undistorter, interval=4)
+        self.assertEqual(image.shape, (2160 // 4, 3840 // 4, 3))
+
+    def test_save_maps(self):
+        with tempfile.TemporaryDirectory() as dirpath:
+            paths = [os.path.join(dirpath, name + EXTENSION)
+                     for name in ('a', 'b')]
+            jobs = [(self.undistorter, path) for path in paths]
+            self.assertEqual(distortionmap.save_maps(jobs, interval=8), paths)
+            self.assertEqual(sorted(os.listdir(dirpath)),
+                             [os.path.basename(path) for path in paths])
+
+    def test_interval(self):
+        parser = ArgsParser()
+        with contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit):
+                parser.parse_args(args=['--models', 'a.model',
+                                        '--interval', '0'])
 
 
 if __name__ == "__main__":
@@ -53,5 +170,12 @@ if __name__ == "__main__":
         test()
         sys.exit()
 
-    data = Data(args.file, in_cols=args.in_cols)
-    main(data, args.size)
+    if args.models:
+        for path in render_models(args.models, args.interval, args.jobs):
+            print(path)
+        sys.exit()
+
+    data = Data(args.file, loc_path=args.location or args.file.name,
+                in_cols=args.in_cols)
+    outpath = map_path(args.file.name) if args.save else None
+    main(data, args.size, args.camera, outpath, args.interval)